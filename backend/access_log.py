@@ -0,0 +1,123 @@
+# backend/access_log.py
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+from starlette.datastructures import Headers
+
+from metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+
+# Longest value written for a single structured field
+MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", 200))
+# Fraction of requests whose headers are logged
+HEADER_SAMPLE_RATE = float(os.getenv("LOG_HEADER_SAMPLE_RATE", 0.01))
+REDACTED_HEADERS = {"authorization", "cookie", "set-cookie", "x-api-key"}
+
+access_logger = logging.getLogger("access")
+
+
+def cap(value, limit: int = MAX_FIELD_CHARS) -> str:
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= limit else f"{text[:limit]}…(+{len(text) - limit})"
+
+
+def render(value) -> str:
+    if isinstance(value, dict):
+        return "{" + " ".join(f"{key}={render(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, str):
+        return repr(cap(value))
+    return cap(value)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Appends the record's ``fields`` extra as capped ``key=value`` pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={render(value)}" for key, value in fields.items())
+        return line
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the message before enqueueing it; we
+    # leave that to the listener thread so callers only pay for a put().
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level=logging.INFO):
+    """Routes all logging through a queue drained by a background thread."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter("%(levelname)s:%(name)s:%(message)s"))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    return listener
+
+
+def sampled_headers(headers) -> dict:
+    return {
+        name: "[redacted]" if name.lower() in REDACTED_HEADERS else value
+        for name, value in headers.items()
+    }
+
+
+class AccessMiddleware:
+    """Access log and request metrics as one pure ASGI middleware.
+
+    Unlike ``BaseHTTPMiddleware`` it adds no task group or memory stream per
+    request; it only wraps ``send``. Duration runs until the final
+    ``http.response.body`` message, so streamed (SSE) responses are timed to
+    their end rather than their first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status, finished = 500, None
+
+        async def send_wrapper(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = time.perf_counter()
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            seconds = (finished or time.perf_counter()) - started
+            # Label by route template, not raw path, to keep the series count bounded
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                seconds, method=scope["method"], route=getattr(route, "path", "unmatched"), status=status
+            )
+            if access_logger.isEnabledFor(logging.INFO):
+                fields = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(seconds * 1000, 1),
+                }
+                if HEADER_SAMPLE_RATE and random.random() < HEADER_SAMPLE_RATE:
+                    fields["headers"] = sampled_headers(Headers(scope=scope))
+                access_logger.info("request", extra={"fields": fields})
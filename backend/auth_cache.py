@@ -0,0 +1,109 @@
+# backend/auth_cache.py
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Google's public certs for Firebase ID tokens
+ID_TOKEN_CERT_URI = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+
+class TokenCache:
+    """Bounded cache of decoded Firebase ID tokens, keyed by token hash.
+
+    Entries expire at the token's own ``exp`` claim. Cold verifications run in
+    a small thread pool so a slow cert fetch never blocks the event loop.
+    ``initialize`` (e.g. Firebase app setup) runs in that pool before the
+    first verification, so firebase_admin is only imported when needed.
+    """
+
+    def __init__(self, max_size: int = 10000, verify_workers: int = 4, initialize=None):
+        self.max_size = max_size
+        self.initialize = initialize
+        self._entries = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=verify_workers, thread_name_prefix="token-verify")
+        self._refresh_task = None
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, decoded = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return decoded
+
+    def put(self, token: str, decoded: dict):
+        expires_at = decoded.get("exp")
+        if not expires_at:
+            return
+        key = self._key(token)
+        self._entries[key] = (float(expires_at), decoded)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def verify(self, token: str) -> dict:
+        decoded = self.get(token)
+        if decoded is not None:
+            return decoded
+        loop = asyncio.get_running_loop()
+        decoded = await loop.run_in_executor(self._executor, self._verify, token)
+        self.put(token, decoded)
+        return decoded
+
+    def _verify(self, token: str) -> dict:
+        if self.initialize:
+            self.initialize()
+        from firebase_admin import auth
+
+        return auth.verify_id_token(token)
+
+    def _refresh_certs(self):
+        if self.initialize:
+            self.initialize()
+        from firebase_admin import auth
+
+        # firebase_admin fetches certs through a cache-control aware session;
+        # hitting the cert URL through that same session keeps it warm so
+        # request-time verification never has to wait on Google.
+        verifier = getattr(auth._get_client(None), "_token_verifier", None)
+        request = getattr(verifier, "request", None)
+        if request is None:
+            return
+        request(url=ID_TOKEN_CERT_URI, method="GET")
+
+    async def warm_certs(self):
+        """Initializes and fetches the certs once, e.g. during startup."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._refresh_certs)
+
+    async def _refresh_loop(self, interval: float, refresh_now: bool):
+        if not refresh_now:
+            await asyncio.sleep(interval)
+        while True:
+            try:
+                await self.warm_certs()
+            except Exception as e:
+                logger.warning("Firebase cert refresh failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def start_cert_refresh(self, interval: float = 3600, refresh_now: bool = True):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval, refresh_now))
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,159 @@
+# backend/batch.py
+import asyncio
+import io
+import json
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+COMPLETIONS_URL = "/v1/chat/completions"
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+# The 24h completion window plus some slack for output to become available
+DEFAULT_TIMEOUT = 26 * 3600
+
+
+class BatchError(Exception):
+    pass
+
+
+def batch_line(custom_id: str, body: dict) -> dict:
+    """One request line in the OpenAI Batch JSONL input format."""
+    return {"custom_id": custom_id, "method": "POST", "url": COMPLETIONS_URL, "body": body}
+
+
+def to_jsonl(lines: list) -> bytes:
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+
+
+def parse_output(text: str) -> dict:
+    """Maps ``custom_id`` to ``{"content", "usage"}`` or ``{"error"}`` from Batch output JSONL."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        body = response.get("body") or {}
+        if entry.get("error") or response.get("status_code", 200) >= 400 or not body.get("choices"):
+            error = entry.get("error") or body.get("error") or {"message": "No completion returned."}
+            results[entry["custom_id"]] = {"error": error.get("message", str(error))}
+        else:
+            results[entry["custom_id"]] = {
+                "content": body["choices"][0]["message"]["content"],
+                "usage": body.get("usage"),
+            }
+    return results
+
+
+class OpenAIBatchBackend:
+    """Submits JSONL to the OpenAI Batch API and collects the output file.
+
+    ``get_client`` returns the AsyncOpenAI client, so it is only built once a
+    batch is actually submitted.
+    """
+
+    def __init__(self, get_client, completion_window: str = "24h"):
+        self.get_client = get_client
+        self.completion_window = completion_window
+
+    async def submit(self, lines: list) -> str:
+        client = self.get_client()
+        upload = await client.files.create(
+            file=(f"lessons-{uuid.uuid4().hex[:8]}.jsonl", io.BytesIO(to_jsonl(lines))),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=upload.id,
+            endpoint=COMPLETIONS_URL,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> str:
+        return (await self.get_client().batches.retrieve(batch_id)).status
+
+    async def results(self, batch_id: str) -> dict:
+        client = self.get_client()
+        batch = await client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.update(parse_output((await client.files.content(file_id)).text))
+        return results
+
+
+class LocalBatchBackend:
+    """Stand-in for the Batch API that runs each line through ``create``.
+
+    ``create`` takes chat completion parameters, e.g. the fake OpenAI server
+    or a cassette in tests. Lines run ``concurrency`` at a time in the
+    background and their output is kept in memory in Batch output format.
+    """
+
+    def __init__(self, create, concurrency: int = 2):
+        self.create = create
+        self.concurrency = concurrency
+        self._batches = {}
+
+    async def submit(self, lines: list) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = asyncio.create_task(self._run(lines))
+        return batch_id
+
+    async def _run(self, lines: list) -> str:
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run_line(line: dict) -> dict:
+            async with slots:
+                try:
+                    response = await self.create(**line["body"])
+                except Exception as e:
+                    return {"custom_id": line["custom_id"], "response": None, "error": {"message": str(e)}}
+            return {
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "body": response.model_dump()},
+                "error": None,
+            }
+
+        return "\n".join(json.dumps(entry) for entry in await asyncio.gather(*map(run_line, lines)))
+
+    async def status(self, batch_id: str) -> str:
+        task = self._batches.get(batch_id)
+        if not task:
+            return "failed"
+        return "completed" if task.done() else "in_progress"
+
+    async def results(self, batch_id: str) -> dict:
+        return parse_output(await self._batches.pop(batch_id))
+
+
+async def run_batch(backend, lines: list, poll_interval: float = 30, timeout: float = DEFAULT_TIMEOUT,
+                    on_submit=None) -> dict:
+    """Submits ``lines``, waits for the batch to finish and returns its parsed results.
+
+    ``on_submit(batch_id)`` is awaited as soon as the batch exists, so the id
+    can be stored and collection resumed by ``wait_for_batch`` after a restart.
+    """
+    batch_id = await backend.submit(lines)
+    logger.info("Submitted batch %s with %s requests", batch_id, len(lines))
+    if on_submit:
+        await on_submit(batch_id)
+    return await wait_for_batch(backend, batch_id, poll_interval, timeout)
+
+
+async def wait_for_batch(backend, batch_id: str, poll_interval: float = 30, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Waits for a submitted batch to finish and returns its parsed results."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = await backend.status(batch_id)
+        if status in TERMINAL_STATES:
+            break
+        if time.monotonic() > deadline:
+            raise BatchError(f"Batch {batch_id} did not finish in time.")
+        await asyncio.sleep(poll_interval)
+    # An expired batch still returns whatever finished within the window.
+    if status not in ("completed", "expired"):
+        raise BatchError(f"Batch {batch_id} ended with status {status}.")
+    return await backend.results(batch_id)
@@ -0,0 +1,85 @@
+# backend/bench/bench_sanitizer.py
+# Compares sanitizer.py with plain bleach.clean on the lessons in user_lessons/.
+#
+#   python -m bench.bench_sanitizer --rounds 200
+import argparse
+import glob
+import json
+import os
+import time
+
+import bleach
+
+from sanitizer import BASIC_FORMATTING, LESSON_MARKUP, STRIP_ALL, Policy
+
+LESSON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "user_lessons")
+
+PHRASES = ["Could I see the menu?", "I'd like a window seat", "on the other hand", "a > b", "Tom & Jerry"]
+
+
+def load_lessons(directory: str) -> list:
+    lessons = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            lessons.extend(entry["lesson"] for entry in json.load(f) if entry.get("lesson"))
+    return lessons
+
+
+def cases(lessons: list) -> list:
+    """(name, bleach kwargs, policy, inputs) for each call site in main.py."""
+    lesson_markup = {"tags": ["b", "strong", "i", "em", "a"], "attributes": {"a": ["href"]}, "strip": True}
+    return [
+        ("lesson output", lesson_markup, LESSON_MARKUP, lessons),
+        ("lesson stream chunks", lesson_markup, LESSON_MARKUP,
+         [lesson[i:i + 16] for lesson in lessons for i in range(0, len(lesson), 16)]),
+        ("answer class_plan", {"tags": ["b", "strong", "i", "em"], "strip": True}, BASIC_FORMATTING, lessons),
+        ("used items", {"tags": [], "strip": True}, STRIP_ALL, PHRASES * 20),
+    ]
+
+
+def timed(fn, inputs: list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in inputs:
+            fn(text)
+    return time.perf_counter() - started
+
+
+def cold_copy(policy: Policy) -> Policy:
+    # Same rules with the memo off: every call pays the parse unless the
+    # plain-text fast path applies, as with real (always new) model output.
+    return Policy(policy.tags, policy.attributes, memo_size=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sanitizer.py against bleach.clean")
+    parser.add_argument("--lessons", default=LESSON_DIR, help="directory of user_lessons JSON files")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    lessons = load_lessons(args.lessons)
+    if not lessons:
+        raise SystemExit(f"No lessons found in {args.lessons}")
+    print(f"{len(lessons)} lessons, {args.rounds} rounds\n")
+    print("cold: memo off, so only the plain-text fast path helps; memo: repeated inputs, for memoized policies\n")
+    print(f"{'case':<22} {'calls':>7} {'bleach ms':>10} {'cold ms':>10} {'speedup':>8} {'memo ms':>10} {'speedup':>8}")
+    for name, kwargs, policy, inputs in cases(lessons):
+        cold = cold_copy(policy)
+        mismatches = sum(cold.clean(text) != bleach.clean(text, **kwargs) for text in inputs)
+        if mismatches:
+            print(f"{name}: {mismatches} outputs differ from bleach")
+        baseline = timed(lambda text: bleach.clean(text, **kwargs), inputs, args.rounds)
+        cold_seconds = timed(cold.clean, inputs, args.rounds)
+        calls = len(inputs) * args.rounds
+        row = f"{name:<22} {calls:>7} {baseline * 1000:>10.1f} {cold_seconds * 1000:>10.1f} {baseline / cold_seconds:>7.1f}x"
+        if policy.memo_size:
+            timed(policy.clean, inputs, 1)
+            memo_seconds = timed(policy.clean, inputs, args.rounds)
+            row += f" {memo_seconds * 1000:>10.1f} {baseline / memo_seconds:>7.1f}x"
+        else:
+            row += f" {'-':>10} {'-':>8}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
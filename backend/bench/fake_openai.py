@@ -0,0 +1,199 @@
+# backend/bench/fake_openai.py
+# Local stand-in for the OpenAI chat completions API.
+#
+#   python -m bench.fake_openai --port 9100 --ttft 0.4 --tokens-mean 1200 --error-rate 0.02
+#
+# Then point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1.
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+CONFIG = {
+    "ttft": float(os.getenv("FAKE_OPENAI_TTFT", 0.5)),
+    "token_latency": float(os.getenv("FAKE_OPENAI_TOKEN_LATENCY", 0.004)),
+    "jitter": float(os.getenv("FAKE_OPENAI_JITTER", 0.2)),
+    "tokens_mean": int(os.getenv("FAKE_OPENAI_TOKENS_MEAN", 1200)),
+    "tokens_sd": int(os.getenv("FAKE_OPENAI_TOKENS_SD", 250)),
+    "error_rate": float(os.getenv("FAKE_OPENAI_429_RATE", 0.0)),
+    "seed": os.getenv("FAKE_OPENAI_SEED"),
+}
+rng = random.Random(CONFIG["seed"])
+
+FILLER = (
+    "Practice this phrase out loud with a partner and notice how the stress falls on the key words. "
+    "Try changing one detail each time so the sentence fits a new situation. "
+)
+
+LESSON = """# {level} {skill} Class
+
+## Welcome
+Hello and welcome! 🚀 Today's **objective** is to build confidence with {skill}.
+
+## Mini-lesson
+| Strategy | Phrase | Why It Works |
+|---|---|---|
+| Ask politely | "Could you help me?" | Sounds friendly |
+| Confirm | "Did you say...?" | Avoids confusion |
+
+**Common Pitfall**: Translating word for word.
+
+## Quick Check
+**Starting a conversation**
+- [ ] Excuse me
+- [ ] Good morning
+**Keeping it going**
+- [ ] That sounds great
+- [ ] Tell me more
+
+## Interactive Practice
+🎙 Describe your last trip. **[AI Feedback]**
+
+## Role-Play Challenge
+🎙 Order a meal at a busy café. **[AI Feedback]**
+
+## Practice Task
+Write a short message to a friend.
+
+## Exercises
+1. Fix 5 sentences with errors.
+2. Complete the gap-fill.
+3. Write 5 sentences using today's phrases.
+
+## Video
+[{skill} Video](https://www.youtube.com/watch?v=R9j00yG2yT4)
+
+## Vocabulary
+| Word | Meaning | Example |
+|---|---|---|
+| itinerary | travel plan | My itinerary is full. |
+| reservation | booking | I have a reservation. |
+| landmark | famous place | The tower is a landmark. |
+| souvenir | keepsake | I bought a souvenir. |
+
+## Badge
+🏅 **Bench Explorer**
+
+## Feedback
+{filler}
+"""
+
+
+def sample_tokens() -> int:
+    return max(50, int(rng.gauss(CONFIG["tokens_mean"], CONFIG["tokens_sd"])))
+
+
+def jittered(seconds: float) -> float:
+    return max(0.0, seconds * (1 + rng.uniform(-CONFIG["jitter"], CONFIG["jitter"])))
+
+
+def completion_text(prompt: str, tokens: int) -> str:
+    level = next((lvl for lvl in ("A1", "A2", "B1", "B2", "C1", "C2") if lvl in prompt), "B1")
+    skill = next((s for s in ("Speaking", "Grammar", "Vocabulary", "Writing", "Reading") if s in prompt), "Speaking")
+    body = LESSON.format(level=level, skill=skill, filler="")
+    missing = max(0, tokens * 4 - len(body))
+    filler = (FILLER * (missing // len(FILLER) + 1))[:missing]
+    return LESSON.format(level=level, skill=skill, filler=filler)
+
+
+def rate_limited() -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        headers={"retry-after": "1"},
+        content={"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+    )
+
+
+@app.get("/v1/models")
+async def models():
+    # The backend lists models at startup to open its first connection
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if rng.random() < CONFIG["error_rate"]:
+        return rate_limited()
+
+    prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+    tokens = sample_tokens()
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    if max_tokens:
+        tokens = min(tokens, int(max_tokens))
+    text = completion_text(prompt, tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-4o-mini")
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": tokens, "total_tokens": len(prompt) // 4 + tokens}
+
+    if not body.get("stream"):
+        await asyncio.sleep(jittered(CONFIG["ttft"] + tokens * CONFIG["token_latency"]))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        await asyncio.sleep(jittered(CONFIG["ttft"]))
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(text), 16):
+            await asyncio.sleep(jittered(CONFIG["token_latency"] * 4))
+            yield chunk({"content": text[start:start + 16]})
+        yield chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft", type=float, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, help="seconds per output token")
+    parser.add_argument("--jitter", type=float, help="relative latency jitter, e.g. 0.2 for ±20%%")
+    parser.add_argument("--tokens-mean", type=int, help="mean completion tokens")
+    parser.add_argument("--tokens-sd", type=int, help="completion token standard deviation")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+    for key in ("ttft", "token_latency", "jitter", "tokens_mean", "tokens_sd", "error_rate"):
+        if getattr(args, key) is not None:
+            CONFIG[key] = getattr(args, key)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
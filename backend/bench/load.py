@@ -0,0 +1,191 @@
+# backend/bench/load.py
+# Load scenarios against a running backend (usually bench.serve).
+#
+#   python -m bench.load generate --concurrency 20 --requests 200 --workers 2
+#   python -m bench.load mixed --duration 60
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+LEVELS = ["A1", "A2", "B1", "B2", "C1", "C2"]
+SKILLS = ["Speaking", "Grammar", "Vocabulary", "Writing", "Reading"]
+TEACHERS = ["Emma", "Liam", "Olivia", "Noah", "Sophia"]
+REASONS = ["travel", "business", "personal growth"]
+
+SAMPLE_PLAN = """## Welcome
+Welcome! Today's objective is ordering food politely.
+## Exercises
+1. Write 5 sentences ordering food.
+2. Rewrite the dialogue using "Could I...?".
+## Vocabulary
+| Word | Meaning | Example |
+|---|---|---|
+| menu | list of dishes | Can I see the menu? |
+## Badge
+🏅 **Café Regular**
+"""
+
+# Calls per user per endpoint before the daily limit kicks in
+CALLS_PER_USER = 5
+
+
+class Scenario:
+    def __init__(self, name: str, run_id: str):
+        self.name = name
+        self.run_id = run_id
+        self.sent = 0
+
+    def token(self) -> str:
+        # Rotate users so the daily rate limit doesn't dominate the results.
+        user = self.sent // CALLS_PER_USER
+        self.sent += 1
+        return f"bench-{self.run_id}-{self.name}-{user}"
+
+    def request(self) -> dict:
+        raise NotImplementedError
+
+
+class Generate(Scenario):
+    def request(self) -> dict:
+        return {
+            "method": "POST",
+            "url": "/generate-class",
+            "json": {
+                "student_level": random.choice(LEVELS),
+                "skill_focus": random.choice(SKILLS),
+                "teacher": random.choice(TEACHERS),
+                "reason": random.choice(REASONS),
+                "age": random.randint(8, 60),
+                "used_phrases": [],
+                "used_vocab": [],
+            },
+        }
+
+
+class Submit(Scenario):
+    def request(self) -> dict:
+        return {
+            "method": "POST",
+            "url": "/submit-answer",
+            "json": {
+                "answer": "Could I have the soup, please? I would like a glass of water too.",
+                "class_plan": SAMPLE_PLAN,
+                "section": "Exercises",
+                "exercise": 1,
+                "student_level": random.choice(LEVELS),
+                "skill_focus": random.choice(SKILLS),
+                "reason": random.choice(REASONS),
+            },
+        }
+
+
+class Remaining(Scenario):
+    def token(self) -> str:
+        return f"bench-{self.run_id}-remaining-{random.randint(0, 999)}"
+
+    def request(self) -> dict:
+        return {"method": "GET", "url": "/remaining-calls"}
+
+
+SCENARIOS = {"generate": Generate, "submit": Submit, "remaining": Remaining}
+# Rough production mix: the quota lookup is polled far more than lessons are generated
+MIXED_WEIGHTS = {"remaining": 6, "generate": 2, "submit": 2}
+
+
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, name: str, status, seconds: float):
+        self.latencies.setdefault(name, []).append(seconds)
+        self.statuses.setdefault(name, Counter())[status] += 1
+
+    def report(self, elapsed: float, workers: int) -> dict:
+        report = {}
+        for name, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            throughput = len(ordered) / elapsed if elapsed else 0.0
+            report[name] = {
+                "requests": len(ordered),
+                "statuses": dict(self.statuses[name]),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+                "throughput_rps": round(throughput, 2),
+                "throughput_rps_per_worker": round(throughput / workers, 2),
+            }
+        return report
+
+
+async def run(args) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    if args.scenario == "mixed":
+        scenarios = [SCENARIOS[name](name, run_id) for name in MIXED_WEIGHTS]
+        weights = list(MIXED_WEIGHTS.values())
+    else:
+        scenarios = [SCENARIOS[args.scenario](args.scenario, run_id)]
+        weights = [1]
+
+    results = Results()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    remaining = [args.requests]
+
+    def next_request():
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        if deadline is None:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+        return random.choices(scenarios, weights)[0]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        async def worker():
+            while (scenario := next_request()) is not None:
+                request = scenario.request()
+                headers = {"Authorization": f"Bearer {scenario.token()}"}
+                started = time.perf_counter()
+                try:
+                    response = await client.request(headers=headers, **request)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                results.record(scenario.name, status, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"scenario": args.scenario, "elapsed_s": round(elapsed, 2), "results": results.report(elapsed, args.workers)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend load scenarios")
+    parser.add_argument("scenario", choices=[*SCENARIOS, "mixed"])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of --requests")
+    parser.add_argument("--workers", type=int, default=1, help="server worker count, for per-worker throughput")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# backend/bench/serve.py
+# Runs the stubbed backend (bench.stub_app) under uvicorn.
+#
+#   python -m bench.serve --workers 2 --redis fake
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the backend with stubbed Firebase/OpenAI/Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--redis", choices=["local", "fake", "none"], default="fake")
+    parser.add_argument("--openai-url", default="http://127.0.0.1:9100/v1")
+    args = parser.parse_args()
+
+    os.environ["BENCH_REDIS"] = args.redis
+    os.environ["OPENAI_BASE_URL"] = args.openai_url
+    uvicorn.run("bench.stub_app:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# backend/bench/stub_app.py
+# The backend app with its external services stubbed out for benchmarking.
+#
+# - Firebase: "Bearer bench-<uid>" tokens are accepted without verification.
+# - OpenAI: OPENAI_BASE_URL should point at bench.fake_openai.
+# - Redis: BENCH_REDIS=fake uses fakeredis, BENCH_REDIS=none forces the
+#   in-process fallback, anything else uses REDIS_URL as configured.
+import os
+import time
+
+os.environ.setdefault("FIREBASE_SERVICE_ACCOUNT_JSON", "{}")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9100/v1")
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+import main  # noqa: E402
+
+
+async def verify_bench_token(token: str) -> dict:
+    if not token.startswith("bench-"):
+        raise ValueError("Benchmark tokens must look like 'bench-<uid>'")
+    return {"uid": token, "exp": time.time() + 3600}
+
+
+def use_redis(client):
+    main.redis_client = client
+    main.rate_limit_script = client.register_script(main.RATE_LIMIT_SCRIPT) if client else None
+    main.lesson_pool.redis_client = client
+    main.lesson_store.redis_client = client
+    main.used_items.redis_client = client
+    main.job_store.redis_client = client
+
+
+async def skip_cert_warm_up():
+    pass
+
+
+main.token_cache.verify = verify_bench_token
+main.token_cache.warm_certs = skip_cert_warm_up
+main.token_cache.start_cert_refresh = lambda *args, **kwargs: None
+
+redis_mode = os.getenv("BENCH_REDIS", "local")
+if redis_mode == "fake":
+    import fakeredis
+
+    use_redis(fakeredis.aioredis.FakeRedis(decode_responses=True))
+elif redis_mode == "none":
+    use_redis(None)
+
+app = main.app
@@ -0,0 +1,182 @@
+# backend/cassette.py
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+from streaming import close_stream
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Request parameters that don't change what the model returns
+IGNORED_PARAMS = {"stream", "stream_options", "timeout", "extra_headers"}
+
+
+class CassetteMissError(Exception):
+    pass
+
+
+def request_key(params: dict) -> str:
+    relevant = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Records chat completions to a gzipped JSONL file and replays them.
+
+    Each entry stores the prompt hash, the completion text, usage and timings
+    (total latency, and chunk offsets for streams). Replay serves the recorded
+    completion for the same request, sleeping the original latency scaled by
+    ``speed`` (0 replays instantly). Repeated recordings of one prompt are
+    replayed in order, round-robin.
+    """
+
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._entries = {}
+        self._cursor = {}
+        if mode == REPLAY:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        logger.info("Loaded %s cassette entries from %s", sum(map(len, self._entries.values())), self.path)
+
+    def _write(self, entry: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _next_entry(self, key: str) -> dict:
+        entries = self._entries.get(key)
+        if not entries:
+            raise CassetteMissError(f"No cassette entry for request {key[:12]}")
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        return entries[index % len(entries)]
+
+    async def _sleep(self, seconds: float):
+        if self.speed and seconds > 0:
+            await asyncio.sleep(seconds * self.speed)
+
+    async def create(self, create, **params):
+        if self.mode == RECORD:
+            return await self._record(create, params)
+        return await self._replay(params)
+
+    # Recording
+    async def _record(self, create, params: dict):
+        key = request_key(params)
+        started = time.perf_counter()
+        result = await create(**params)
+        if params.get("stream"):
+            return self._record_stream(key, params, result, started)
+        self._write({
+            "key": key,
+            "model": result.model,
+            "content": result.choices[0].message.content,
+            "finish_reason": result.choices[0].finish_reason,
+            "usage": result.usage.model_dump() if result.usage else None,
+            "latency": round(time.perf_counter() - started, 4),
+        })
+        return result
+
+    async def _record_stream(self, key: str, params: dict, stream, started: float):
+        chunks, usage, model, finish_reason = [], None, params.get("model"), None
+        try:
+            async for chunk in stream:
+                model = chunk.model
+                if chunk.usage:
+                    usage = chunk.usage.model_dump()
+                if chunk.choices:
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        chunks.append([round(time.perf_counter() - started, 4), text])
+                yield chunk
+        finally:
+            await close_stream(stream)
+        self._write({
+            "key": key,
+            "model": model,
+            "content": "".join(text for _, text in chunks),
+            "finish_reason": finish_reason or "stop",
+            "usage": usage,
+            "latency": round(time.perf_counter() - started, 4),
+            "chunks": chunks,
+        })
+
+    # Replay
+    async def _replay(self, params: dict):
+        # Imported here so replaying doesn't pay for the openai package at startup
+        from openai.types.chat import ChatCompletion
+
+        entry = self._next_entry(request_key(params))
+        if params.get("stream"):
+            return self._replay_stream(entry)
+        await self._sleep(entry["latency"])
+        return ChatCompletion.model_validate({
+            "id": f"cassette-{entry['key'][:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": entry["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": entry["content"]},
+                "finish_reason": entry["finish_reason"],
+            }],
+            "usage": entry["usage"],
+        })
+
+    async def _replay_stream(self, entry: dict):
+        from openai.types.chat import ChatCompletionChunk
+
+        chunks = entry.get("chunks")
+        if not chunks:
+            # Recorded without streaming: spread the text evenly over the latency.
+            content, pieces = entry["content"] or "", 50
+            size = max(1, len(content) // pieces)
+            step = entry["latency"] / pieces
+            chunks = [[step * (i // size + 1), content[i:i + size]] for i in range(0, len(content), size)]
+
+        def chunk(delta: dict, finish_reason=None) -> ChatCompletionChunk:
+            return ChatCompletionChunk.model_validate({
+                "id": f"cassette-{entry['key'][:24]}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": entry["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            })
+
+        elapsed = 0.0
+        for offset, text in chunks:
+            await self._sleep(offset - elapsed)
+            elapsed = offset
+            yield chunk({"content": text})
+        yield chunk({}, entry["finish_reason"])
+
+
+def cassette_from_env():
+    path = os.getenv("OPENAI_CASSETTE")
+    if not path:
+        return None
+    mode = os.getenv("OPENAI_CASSETTE_MODE", REPLAY)
+    speed = float(os.getenv("OPENAI_CASSETTE_SPEED", 1.0))
+    logger.info("OpenAI cassette %s mode: %s (speed %s)", mode, path, speed)
+    return Cassette(path, mode, speed)
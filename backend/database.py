@@ -0,0 +1,121 @@
+# backend/database.py
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lessons.sqlite3")
+USER_LESSONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_lessons")
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress(body: bytes) -> str:
+    return zlib.decompress(body).decode("utf-8")
+
+
+class LessonDatabase:
+    """Durable lesson history in SQLite (WAL mode).
+
+    One row per lesson with a zlib-compressed body, indexed on
+    (user_id, created_at), so saving or loading a lesson touches one row
+    no matter how long the user's history is. Connections are per thread;
+    call the methods through ``asyncio.to_thread`` from async code.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lessons ("
+                " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at REAL NOT NULL,"
+                " meta TEXT NOT NULL, body BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS lessons_user_created ON lessons (user_id, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, lesson_id: str, user_id: str, class_plan: str, created_at: float, **meta) -> bool:
+        """Stores a lesson; returns False if ``lesson_id`` already exists."""
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO lessons (id, user_id, created_at, meta, body) VALUES (?, ?, ?, ?, ?)",
+            (lesson_id, user_id, created_at, json.dumps(meta), compress(class_plan)),
+        )
+        return cursor.rowcount > 0
+
+    def get(self, lesson_id: str):
+        row = self._connect().execute(
+            "SELECT user_id, created_at, meta, body FROM lessons WHERE id = ?", (lesson_id,)
+        ).fetchone()
+        if not row:
+            return None
+        user_id, created_at, meta, body = row
+        return {"user_id": user_id, "class_plan": decompress(body), "created_at": created_at, **json.loads(meta)}
+
+    def history(self, user_id: str, limit: int = 20, before: float = None) -> list:
+        """Newest-first lesson metadata for a user, without the bodies."""
+        rows = self._connect().execute(
+            "SELECT id, created_at, meta FROM lessons WHERE user_id = ? AND created_at < ?"
+            " ORDER BY created_at DESC LIMIT ?",
+            (user_id, before if before is not None else float("inf"), limit),
+        )
+        return [{"lesson_id": lesson_id, "created_at": created_at, **json.loads(meta)} for lesson_id, created_at, meta in rows]
+
+    def import_user_lessons(self, directory: str = USER_LESSONS_DIR) -> int:
+        """Imports the legacy ``user_lessons/<user>.json`` arrays.
+
+        Ids are derived from user and timestamp, so running it twice is harmless.
+        Returns the number of lessons added.
+        """
+        imported = 0
+        conn = self._connect()
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            user_id = name[:-len(".json")]
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                entries = json.load(f)
+            conn.execute("BEGIN")
+            try:
+                for entry in entries:
+                    timestamp = entry.get("timestamp")
+                    lesson_id = hashlib.sha256(f"{user_id}:{timestamp}".encode("utf-8")).hexdigest()[:32]
+                    created_at = datetime.fromisoformat(timestamp).timestamp() if timestamp else 0.0
+                    imported += self.save(lesson_id, user_id, entry.get("lesson") or "", created_at, imported=True)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info("Imported lessons for %s from %s", user_id, name)
+        return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import legacy user_lessons JSON files into the lesson database")
+    parser.add_argument("directory", nargs="?", default=USER_LESSONS_DIR)
+    parser.add_argument("--db", default=os.getenv("LESSON_DB_PATH", DEFAULT_PATH))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    count = LessonDatabase(args.db).import_user_lessons(args.directory)
+    print(f"Imported {count} lessons into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# backend/fallback_limits.py
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+CAP_CHECK_INTERVAL = 100
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "language_arcade_limits.sqlite3")
+
+
+class FallbackLimitStore:
+    """Daily quota counters used while Redis is unavailable.
+
+    Counters live in a small SQLite file in WAL mode, so every worker process
+    on the host sees the same counts. Rows from previous days are dropped in
+    bulk the first time a new day is seen. Past ``max_rows`` the oldest rows
+    are evicted, which keeps the file bounded at the cost of forgetting a
+    few counts.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_rows: int = 100000):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._day = None
+        self._inserts = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota ("
+                " day TEXT NOT NULL, user_id TEXT NOT NULL, endpoint TEXT NOT NULL,"
+                " calls INTEGER NOT NULL, updated_at INTEGER NOT NULL,"
+                " PRIMARY KEY (day, user_id, endpoint)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS quota_updated ON quota (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _roll_day(self, conn: sqlite3.Connection, today: str):
+        if self._day != today:
+            deleted = conn.execute("DELETE FROM quota WHERE day < ?", (today,)).rowcount
+            if deleted:
+                logger.info("Expired %s fallback quota rows before %s", deleted, today)
+            self._day = today
+
+    def _enforce_cap(self, conn: sqlite3.Connection):
+        excess = conn.execute("SELECT COUNT(*) FROM quota").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM quota WHERE (day, user_id, endpoint) IN "
+                "(SELECT day, user_id, endpoint FROM quota ORDER BY updated_at LIMIT ?)",
+                (excess,),
+            )
+
+    def usage(self, user_id: str) -> dict:
+        today = date.today().isoformat()
+        conn = self._connect()
+        self._roll_day(conn, today)
+        rows = conn.execute("SELECT endpoint, calls FROM quota WHERE day = ? AND user_id = ?", (today, user_id))
+        return {endpoint: calls for endpoint, calls in rows}
+
+    def increment(self, user_id: str, endpoint: str, limit: int, cost: int = 1) -> int:
+        """Adds ``cost`` to today's counter unless that would exceed ``limit``.
+
+        Returns the new count, or -1 if the limit would be exceeded.
+        """
+        today = date.today().isoformat()
+        conn = self._connect()
+        self._roll_day(conn, today)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT calls FROM quota WHERE day = ? AND user_id = ? AND endpoint = ?", (today, user_id, endpoint)
+            ).fetchone()
+            calls = row[0] if row else 0
+            if calls + cost > limit:
+                conn.execute("COMMIT")
+                return -1
+            calls += cost
+            conn.execute(
+                "INSERT INTO quota (day, user_id, endpoint, calls, updated_at) VALUES (?, ?, ?, ?, strftime('%s'))"
+                " ON CONFLICT (day, user_id, endpoint) DO UPDATE SET calls = excluded.calls, updated_at = excluded.updated_at",
+                (today, user_id, endpoint, calls),
+            )
+            if not row:
+                # Counting rows isn't free, so only check the cap every so often.
+                self._inserts += 1
+                if self._inserts % CAP_CHECK_INTERVAL == 0:
+                    self._enforce_cap(conn)
+            conn.execute("COMMIT")
+            return calls
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refund(self, user_id: str, endpoint: str, cost: int = 1):
+        """Gives back ``cost`` calls charged today for work that was never started."""
+        conn = self._connect()
+        conn.execute(
+            "UPDATE quota SET calls = MAX(calls - ?, 0), updated_at = strftime('%s')"
+            " WHERE day = ? AND user_id = ? AND endpoint = ?",
+            (cost, date.today().isoformat(), user_id, endpoint),
+        )
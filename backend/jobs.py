@@ -0,0 +1,386 @@
+# backend/jobs.py
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import httpx
+import redis
+
+from metrics import REDIS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+# Kept in the job record for the server's own use, never returned to clients
+PRIVATE_FIELDS = ("id", "user_id", "resume", "webhook")
+
+
+# Seconds a webhook signature stays valid for receivers using verify_webhook
+WEBHOOK_TOLERANCE = 300
+INTERRUPTED = {
+    "status_code": 503,
+    "detail": "Lesson generation was interrupted by a server restart. Please try again.",
+}
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+def sign_webhook(secret: str, body: bytes, timestamp: int = None) -> str:
+    """The ``X-Webhook-Signature`` header value for ``body``: ``t=<unix time>,v1=<hex>``.
+
+    ``v1`` is the HMAC-SHA256, keyed with the shared secret, of
+    ``"<t>." + body``.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_webhook(secret: str, body: bytes, header: str, tolerance: int = WEBHOOK_TOLERANCE) -> bool:
+    """Checks a webhook as a receiver should: the raw request body against its header.
+
+    Recompute the HMAC over ``"<t>." + raw body`` with the shared secret,
+    compare in constant time, and reject timestamps more than ``tolerance``
+    seconds old to stop replays.
+    """
+    try:
+        fields = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = int(fields["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = sign_webhook(secret, body, timestamp).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, fields.get("v1", ""))
+
+
+def public_view(job: dict) -> dict:
+    """The job as returned to clients: ``job_id`` first, without the owner."""
+    return {"job_id": job["id"], **{key: value for key, value in job.items() if key not in PRIVATE_FIELDS}}
+
+
+class JobStore:
+    """Job state, shared through Redis with a bounded in-process fallback.
+
+    Jobs are JSON under ``job:{id}`` with a TTL. Idempotency keys map to the
+    job they first created, so a retried submission finds the same job.
+    Unfinished jobs that can be resumed are tracked in ``jobs:{runner}`` sets,
+    and a ``job_lease:{id}`` key names the worker currently running each one.
+    """
+
+    def __init__(self, redis_client, ttl: int = 86400, max_local: int = 5000):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_local = max_local
+        self._local = OrderedDict()
+        self._tracked = {}
+        self._leases = {}
+
+    def _remember(self, key: str, value: str):
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+
+    async def put(self, job_id: str, job: dict, ttl: int = None):
+        raw = json.dumps(job)
+        self._remember(f"job:{job_id}", raw)
+        if self.redis_client:
+            try:
+                await self.redis_client.set(f"job:{job_id}", raw, ex=ttl or self.ttl)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not store job %s in Redis: %s", job_id, e)
+
+    async def get(self, job_id: str):
+        raw = None
+        if self.redis_client:
+            try:
+                raw = await self.redis_client.get(f"job:{job_id}")
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not load job %s from Redis: %s", job_id, e)
+        raw = raw or self._local.get(f"job:{job_id}")
+        return json.loads(raw) if raw else None
+
+    async def update(self, job_id: str, ttl: int = None, **fields):
+        """Merges ``fields`` into a stored job, e.g. an upstream id recorded mid-run."""
+        job = await self.get(job_id)
+        if job:
+            job.update(fields)
+            await self.put(job_id, job, ttl)
+        return job
+
+    async def track(self, runner: str, job_id: str):
+        self._tracked.setdefault(runner, set()).add(job_id)
+        if self.redis_client:
+            try:
+                await self.redis_client.sadd(f"jobs:{runner}", job_id)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not track job %s in Redis: %s", job_id, e)
+
+    async def untrack(self, runner: str, job_id: str):
+        self._tracked.get(runner, set()).discard(job_id)
+        self._leases.pop(job_id, None)
+        if self.redis_client:
+            try:
+                await self.redis_client.srem(f"jobs:{runner}", job_id)
+                await self.redis_client.delete(f"job_lease:{job_id}")
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not untrack job %s in Redis: %s", job_id, e)
+
+    async def tracked(self, runner: str) -> set:
+        if self.redis_client:
+            try:
+                return set(await self.redis_client.smembers(f"jobs:{runner}"))
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not list tracked jobs from Redis: %s", e)
+        return set(self._tracked.get(runner, ()))
+
+    async def lease(self, job_id: str, owner: str, seconds: int) -> bool:
+        """Takes or renews ``owner``'s lease on a job; False if another worker holds it."""
+        if self.redis_client:
+            key = f"job_lease:{job_id}"
+            try:
+                if await self.redis_client.set(key, owner, ex=seconds, nx=True):
+                    return True
+                if await self.redis_client.get(key) == owner:
+                    await self.redis_client.expire(key, seconds)
+                    return True
+                return False
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not lease job %s in Redis: %s", job_id, e)
+        holder = self._leases.setdefault(job_id, owner)
+        return holder == owner
+
+    async def claim(self, user_id: str, idempotency_key: str, job_id: str) -> str:
+        """Binds ``idempotency_key`` to ``job_id`` unless it already names a job; returns the bound id."""
+        key = f"job_key:{user_id}:{idempotency_key}"
+        if self.redis_client:
+            try:
+                if await self.redis_client.set(key, job_id, ex=self.ttl, nx=True):
+                    return job_id
+                return await self.redis_client.get(key) or job_id
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not claim idempotency key for %s: %s", user_id, e)
+        existing = self._local.get(key)
+        if existing:
+            return existing
+        self._remember(key, job_id)
+        return job_id
+
+    async def release(self, user_id: str, idempotency_key: str):
+        """Frees a key whose job was never submitted, so a retry can create it."""
+        key = f"job_key:{user_id}:{idempotency_key}"
+        self._local.pop(key, None)
+        if self.redis_client:
+            try:
+                await self.redis_client.delete(key)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="jobs")
+                logger.warning("Could not release idempotency key for %s: %s", user_id, e)
+
+
+class JobRunner:
+    """Runs submitted jobs on a fixed number of worker tasks.
+
+    ``submit`` enqueues and returns at once; at most ``workers`` jobs run at a
+    time and at most ``max_queue`` wait, beyond which JobQueueFullError is
+    raised. Results and failures are written to the JobStore, and optionally
+    POSTed to the job's webhook, signed with ``webhook_secret`` (see
+    ``sign_webhook``); without a secret no webhook is accepted.
+
+    Every unfinished job is tracked under the runner's ``name`` and leased to
+    the worker holding it, which renews the lease until the job finishes. Any
+    worker finding a tracked job whose lease has lapsed (its worker restarted)
+    either passes it to ``resume(job)`` for a new run callable and queues it
+    again, or, without ``resume``, marks it failed so it doesn't stay queued
+    forever. ``ttl`` overrides the store's TTL for long-running jobs.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 8, max_queue: int = 200,
+                 webhook_hosts: set = frozenset(), webhook_timeout: float = 5.0, webhook_secret: str = None,
+                 name: str = "jobs", ttl: int = None, resume=None, lease_seconds: int = 90):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.webhook_hosts = set(webhook_hosts)
+        self.webhook_timeout = webhook_timeout
+        self.webhook_secret = webhook_secret
+        self.name = name
+        self.ttl = ttl
+        self.resume = resume
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._queue = None
+        self._tasks = []
+        self._events = {}
+        self._held = set()
+
+    def webhook_allowed(self, url: str) -> bool:
+        parsed = urlparse(url)
+        return bool(self.webhook_secret) and parsed.scheme == "https" and parsed.hostname in self.webhook_hosts
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recover_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def full(self) -> bool:
+        """True when ``submit`` would raise JobQueueFullError, so callers can check before charging."""
+        return self._queue is not None and self._queue.full()
+
+    async def submit(self, job_id: str, user_id: str, run, webhook: str = None, resume: dict = None) -> dict:
+        """Queues ``run`` (an async callable returning a JSON-able result) as a new job.
+
+        ``resume`` is JSON-able state from which ``self.resume`` can rebuild
+        ``run`` in another process.
+        """
+        self.start()
+        if self._queue.full():
+            raise JobQueueFullError("Too many lessons are being generated right now.")
+        job = {"id": job_id, "user_id": user_id, "status": QUEUED, "created_at": time.time(), "webhook": webhook}
+        if resume is not None:
+            job["resume"] = resume
+        await self.store.put(job_id, job, self.ttl)
+        await self.store.lease(job_id, self.owner, self.lease_seconds)
+        self._held.add(job_id)
+        await self.store.track(self.name, job_id)
+        self._enqueue(job, run, webhook)
+        return job
+
+    def _enqueue(self, job: dict, run, webhook: str):
+        self._events[job["id"]] = asyncio.Event()
+        self._queue.put_nowait((job, run, webhook))
+
+    async def _recover_loop(self):
+        while True:
+            try:
+                for job_id in list(self._held):
+                    await self.store.lease(job_id, self.owner, self.lease_seconds)
+                await self.recover()
+            except Exception as e:
+                logger.warning("Job recovery for %s failed: %s", self.name, e)
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def recover(self):
+        """Queues tracked jobs that no live worker holds, e.g. after a restart."""
+        for job_id in await self.store.tracked(self.name):
+            if job_id in self._held or self._queue.full():
+                continue
+            job = await self.store.get(job_id)
+            if not job or job["status"] in FINISHED:
+                await self.store.untrack(self.name, job_id)
+                continue
+            if not await self.store.lease(job_id, self.owner, self.lease_seconds):
+                continue
+            if self.resume and job.get("resume"):
+                logger.info("Resuming job %s", job_id)
+                self._held.add(job_id)
+                self._enqueue(job, self.resume(job), job.get("webhook"))
+                continue
+            # Its worker is gone and the job can't be rebuilt here.
+            logger.warning("Job %s was interrupted by a restart, marking it failed", job_id)
+            job = {**job, "status": FAILED, "error": INTERRUPTED, "finished_at": time.time()}
+            job.pop("resume", None)
+            await self.store.put(job_id, job, self.ttl)
+            await self.store.untrack(self.name, job_id)
+            if job.get("webhook"):
+                await self._notify(job["webhook"], job)
+
+    async def _work(self):
+        while True:
+            job, run, webhook = await self._queue.get()
+            try:
+                await self._run(job, run, webhook)
+            except Exception as e:
+                logger.error("Job %s crashed: %s", job["id"], e)
+            finally:
+                self._queue.task_done()
+                event = self._events.pop(job["id"], None)
+                if event:
+                    event.set()
+
+    async def _run(self, job: dict, run, webhook: str):
+        job = {**job, "status": RUNNING, "started_at": time.time()}
+        await self.store.put(job["id"], job, self.ttl)
+        try:
+            job["result"] = await run()
+            job["status"] = DONE
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job["status"] = FAILED
+            job["error"] = {
+                "status_code": getattr(e, "status_code", 500),
+                "detail": getattr(e, "detail", None) or "Lesson generation failed.",
+            }
+        job["finished_at"] = time.time()
+        job.pop("resume", None)
+        await self.store.put(job["id"], job, self.ttl)
+        if job["id"] in self._held:
+            self._held.discard(job["id"])
+            await self.store.untrack(self.name, job["id"])
+        if webhook:
+            await self._notify(webhook, job)
+
+    async def _notify(self, url: str, job: dict):
+        body = json.dumps(public_view(job)).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-Webhook-Signature": sign_webhook(self.webhook_secret, body)}
+        try:
+            async with httpx.AsyncClient(timeout=self.webhook_timeout, follow_redirects=False) as client:
+                response = await client.post(url, content=body, headers=headers)
+            if response.status_code >= 400:
+                logger.warning("Webhook for job %s returned %s", job["id"], response.status_code)
+        except httpx.HTTPError as e:
+            logger.warning("Webhook for job %s failed: %s", job["id"], e)
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 0.5):
+        """Returns the job once it has finished or ``timeout`` has passed.
+
+        Jobs running in this process wake the waiter directly; jobs owned by
+        another worker are polled from the store.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if not job or job["status"] in FINISHED or remaining <= 0:
+                return job
+            event = self._events.get(job_id)
+            try:
+                if event:
+                    await asyncio.wait_for(event.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
@@ -0,0 +1,205 @@
+# backend/lesson_cache.py
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+from lesson_pool import age_group, reason_bucket
+
+# Width of the hashed feature vectors
+VECTOR_DIM = 1024
+
+
+def cache_params(req) -> dict:
+    """Canonical form of the request fields that shape a lesson."""
+    return {
+        "student_level": req.student_level,
+        "skill_focus": req.skill_focus,
+        "module_lesson": req.module_lesson,
+        "teacher": req.teacher,
+        "age_group": age_group(req.age),
+        "reason": " ".join((req.reason or "").split()).casefold(),
+    }
+
+
+def cache_key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Near-duplicates must match on these exactly; only the reason is compared
+# by similarity, so a lesson never crosses age groups or teachers.
+GROUP_FIELDS = ("student_level", "skill_focus", "module_lesson", "teacher", "age_group")
+
+
+def group_key(params: dict) -> int:
+    text = "|".join(str(params[field]) for field in GROUP_FIELDS)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def shareable(params: dict) -> bool:
+    # A lesson written from a user's own free-text reason may quote it, so only
+    # lessons generated from a bare reason bucket are offered to other users.
+    return params["reason"] in ("", reason_bucket(params["reason"]))
+
+
+def features(params: dict) -> list:
+    reason = reason_bucket(params["reason"])
+    words = re.findall(r"\w+", reason)
+    padded = f" {reason} "
+    return (
+        [f"w:{word}" for word in words]
+        + [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        + [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    )
+
+
+def numpy():
+    # Imported on first use so app startup doesn't pay for NumPy
+    import numpy
+
+    return numpy
+
+
+def vectorize(params: dict):
+    np = numpy()
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for feature in features(params):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest()
+        index = int.from_bytes(digest, "big")
+        vector[index % VECTOR_DIM] += 1.0 if index & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class LessonCache:
+    """Reusable generated lessons, looked up by exact inputs or by similarity.
+
+    Exact hits are keyed on a hash of the canonical request inputs. On a miss,
+    lessons with the same level, skill, module, teacher and age group are
+    ranked by the cosine similarity of hashed n-gram vectors of the bucketed
+    reason, held as rows of a NumPy matrix. Only lessons generated from a bare
+    reason bucket get a row, so a near match never hands out a lesson written
+    from another user's free-text reason. Entries are evicted least
+    recently used first once ``max_entries`` or ``max_bytes`` is exceeded, and
+    expire ``ttl`` seconds after they were added. The cache is per process;
+    its matrix is allocated when the first lesson is added.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: int = 7 * 86400, min_similarity: float = 0.8):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self._vectors = None
+        self._groups = None
+        self._row_ids = []
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry["size"]
+        ids = self._by_key[entry["key"]]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_key[entry["key"]]
+        if entry["row"] is None:
+            return
+        # Move the last row into the freed slot to keep the matrix dense.
+        row, last = entry["row"], len(self._row_ids) - 1
+        if row != last:
+            moved_id = self._row_ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._groups[row] = self._groups[last]
+            self._row_ids[row] = moved_id
+            self._entries[moved_id]["row"] = row
+        self._row_ids.pop()
+
+    def _fresh(self, entry: dict) -> bool:
+        return time.time() - entry["created_at"] <= self.ttl
+
+    def _evict(self, incoming: int = 0):
+        now = time.time()
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if (len(self._entries) + (1 if incoming else 0) > self.max_entries
+                    or self._bytes + incoming > self.max_bytes
+                    or now - entry["created_at"] > self.ttl):
+                self._remove(entry_id)
+            else:
+                break
+
+    def add(self, params: dict, class_plan: str, vocabulary: list = (), phrases: list = ()):
+        if not self.max_entries:
+            return
+        key = cache_key(params)
+        if any(self._entries[entry_id]["class_plan"] == class_plan for entry_id in self._by_key.get(key, ())):
+            return
+        size = len(class_plan.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._evict(size)
+        entry_id = f"{key[:16]}:{time.monotonic_ns()}"
+        if self._vectors is None:
+            np = numpy()
+            self._vectors = np.zeros((self.max_entries, VECTOR_DIM), dtype=np.float32)
+            self._groups = np.zeros(self.max_entries, dtype=np.int64)
+        row = None
+        if shareable(params):
+            row = len(self._row_ids)
+            self._vectors[row] = vectorize(params)
+            self._groups[row] = group_key(params)
+            self._row_ids.append(entry_id)
+        self._entries[entry_id] = {
+            "id": entry_id,
+            "key": key,
+            "group": tuple(params[field] for field in GROUP_FIELDS),
+            "row": row,
+            "class_plan": class_plan,
+            "vocabulary": list(vocabulary),
+            "phrases": list(phrases),
+            "created_at": time.time(),
+            "size": size,
+        }
+        self._by_key.setdefault(key, []).append(entry_id)
+        self._bytes += size
+
+    def candidates(self, params: dict, limit: int = 5) -> list:
+        """Returns up to ``limit`` cached lessons for ``params``, best first.
+
+        Exact matches come first, then near-duplicates above ``min_similarity``
+        from the shareable rows. Each result is the cache entry plus a
+        ``match`` of "exact" or "similar".
+        """
+        self._evict()
+        key = cache_key(params)
+        results = [
+            {**self._entries[entry_id], "match": "exact"}
+            for entry_id in reversed(self._by_key.get(key, []))
+            if self._fresh(self._entries[entry_id])
+        ][:limit]
+
+        group = tuple(params[field] for field in GROUP_FIELDS)
+        rows = len(self._row_ids)
+        if len(results) < limit and rows:
+            mask = self._groups[:rows] == group_key(params)
+            if mask.any():
+                scores = self._vectors[:rows] @ vectorize(params)
+                scores[~mask] = -1.0
+                for row in numpy().argsort(-scores)[:limit]:
+                    if scores[row] < self.min_similarity or len(results) >= limit:
+                        break
+                    entry = self._entries[self._row_ids[row]]
+                    # Guards against group hash collisions as well
+                    if entry["key"] != key and entry["group"] == group and self._fresh(entry):
+                        results.append({**entry, "match": "similar"})
+
+        for result in results:
+            self._entries.move_to_end(result["id"])
+        return results
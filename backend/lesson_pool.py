@@ -0,0 +1,194 @@
+# backend/lesson_pool.py
+import asyncio
+import json
+import logging
+import re
+import time
+
+import redis
+
+from metrics import REDIS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Age used when pre-generating a lesson for each age group
+REPRESENTATIVE_AGES = {"young learner": 9, "teenager": 15, "adult": 30}
+
+
+def age_group(age: int) -> str:
+    return "young learner" if age < 12 else "teenager" if 12 <= age <= 17 else "adult"
+
+
+def reason_bucket(reason: str) -> str:
+    reason = (reason or "").lower()
+    return "business" if "business" in reason else "travel" if "travel" in reason else "personal growth"
+
+
+def pool_params(req, tier: str = "free") -> dict:
+    """Maps a ClassRequest and tier onto the discrete parameter tuple the pool is keyed by.
+
+    Only fields the lesson prompt reads belong here; anything else would split
+    the pool into tuples that generate interchangeable lessons.
+    """
+    group = age_group(req.age)
+    return {
+        "tier": tier,
+        "student_level": req.student_level,
+        "skill_focus": req.skill_focus,
+        "teacher": req.teacher,
+        "reason": reason_bucket(req.reason),
+        "age": REPRESENTATIVE_AGES[group],
+    }
+
+
+def pool_key(params: dict) -> str:
+    return "lesson_pool:{tier}:{student_level}:{skill_focus}:{teacher}:{reason}:{age}".format(**params)
+
+
+def avoid_pattern(avoid: list):
+    terms = sorted({str(term).strip() for term in avoid if str(term).strip()}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(term) for term in terms) + r")(?!\w)", re.IGNORECASE)
+
+
+class LessonPool:
+    """Keeps a few ready-made lessons per parameter tuple and refills in the background.
+
+    Lessons live in a Redis list per tuple so every worker shares them, with a
+    process-local fallback when Redis is unavailable. ``generate`` is an async
+    callable that takes the parameter dict (including the tier, which picks
+    the route) and returns a sanitized lesson.
+
+    A tuple is refilled after a miss or once a take leaves fewer than
+    ``low_water`` lessons. Refills are unbilled upstream calls, so all workers
+    share a budget of ``refills_per_hour`` generations (0 for no limit).
+    """
+
+    def __init__(self, redis_client, generate, size: int = 2, max_refills: int = 4, ttl: int = 7 * 86400,
+                 low_water: int = 1, refills_per_hour: int = 60):
+        self.redis_client = redis_client
+        self.generate = generate
+        self.size = size
+        self.ttl = ttl
+        self.low_water = low_water
+        self.refills_per_hour = refills_per_hour
+        self._budget = (None, 0)
+        self._local = {}
+        self._refilling = set()
+        self._tasks = set()
+        self._refill_slots = asyncio.Semaphore(max_refills)
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def _entries(self, key: str) -> list:
+        if self.redis_client:
+            try:
+                return await self.redis_client.lrange(key, 0, -1)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="lesson_pool")
+                logger.warning("Lesson pool Redis read failed for %s: %s", key, e)
+        return list(self._local.get(key, []))
+
+    async def _remove(self, key: str, entry: str) -> bool:
+        if self.redis_client:
+            try:
+                return bool(await self.redis_client.lrem(key, 1, entry))
+            except redis.exceptions.RedisError:
+                REDIS_ERRORS.inc(operation="lesson_pool")
+        local = self._local.get(key, [])
+        if entry in local:
+            local.remove(entry)
+            return True
+        return False
+
+    async def _push(self, key: str, entry: str) -> int:
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.rpush(key, entry)
+                pipe.ltrim(key, -self.size, -1)
+                pipe.expire(key, self.ttl)
+                pipe.llen(key)
+                return (await pipe.execute())[-1]
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="lesson_pool")
+                logger.warning("Lesson pool Redis write failed for %s: %s", key, e)
+        local = self._local.setdefault(key, [])
+        local.append(entry)
+        del local[:-self.size]
+        return len(local)
+
+    async def take(self, req, avoid: list, tier: str = "free"):
+        """Pops a pooled lesson that uses none of the ``avoid`` terms, or returns None."""
+        if not self.enabled:
+            return None
+        params = pool_params(req, tier)
+        key = pool_key(params)
+        pattern = avoid_pattern(avoid)
+        entries = await self._entries(key)
+        lesson = None
+        for entry in entries:
+            class_plan = json.loads(entry)["class_plan"]
+            if pattern and pattern.search(class_plan):
+                continue
+            if await self._remove(key, entry):
+                lesson = class_plan
+                break
+        if lesson is None or len(entries) - 1 < self.low_water:
+            self.schedule_refill(params)
+        return lesson
+
+    async def _spend_refill(self) -> bool:
+        """Counts one refill against the hourly budget; False once it is spent."""
+        if not self.refills_per_hour:
+            return True
+        hour = int(time.time() // 3600)
+        if self.redis_client:
+            key = f"lesson_pool_refills:{hour}"
+            try:
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.incr(key)
+                pipe.expire(key, 3600)
+                return (await pipe.execute())[0] <= self.refills_per_hour
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="lesson_pool")
+                logger.warning("Lesson pool refill budget unavailable in Redis: %s", e)
+        window, used = self._budget
+        used = used + 1 if window == hour else 1
+        self._budget = (hour, used)
+        return used <= self.refills_per_hour
+
+    def schedule_refill(self, params: dict):
+        if not self.enabled:
+            return
+        key = pool_key(params)
+        if key in self._refilling:
+            return
+        self._refilling.add(key)
+        task = asyncio.create_task(self._refill(key, params))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: str, params: dict):
+        try:
+            for _ in range(self.size):
+                if len(await self._entries(key)) >= self.size:
+                    break
+                if not await self._spend_refill():
+                    logger.info("Lesson pool refill budget spent, skipping %s", key)
+                    break
+                async with self._refill_slots:
+                    class_plan = await self.generate(params)
+                await self._push(key, json.dumps({"class_plan": class_plan}))
+                logger.info("Lesson pool refilled %s", key)
+        except Exception as e:
+            logger.warning("Lesson pool refill failed for %s: %s", key, e)
+        finally:
+            self._refilling.discard(key)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,257 @@
+# backend/lesson_sections.py
+import re
+
+HEADING_RE = re.compile(r"^##\s+(.+?)\s*$")
+EXERCISE_RE = re.compile(r"^\s*(?:\d+\.|[-*])\s+")
+SUBHEADING_RE = re.compile(r"^#{3,6}\s+\S")
+# A markdown table delimiter row: |---|---|, |:-|:-:|, --- | --- and so on
+TABLE_SEPARATOR_RE = re.compile(r"\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+
+# Rough characters-per-token ratio for English markdown
+CHARS_PER_TOKEN = 4
+
+
+def normalize_heading(heading: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", heading.lower()).strip()
+
+
+def split_sections(class_plan: str) -> dict:
+    """Splits a lesson into ``{heading: body}`` on its ``## `` headings, preserving order."""
+    sections = {}
+    heading, body = None, []
+    for line in class_plan.split("\n"):
+        match = HEADING_RE.match(line)
+        if match:
+            if heading is not None:
+                sections[heading] = "\n".join(body).strip()
+            heading, body = match.group(1), []
+        elif heading is not None:
+            body.append(line)
+    if heading is not None:
+        sections[heading] = "\n".join(body).strip()
+    return sections
+
+
+def find_section(sections: dict, name: str):
+    wanted = normalize_heading(name)
+    for heading, body in sections.items():
+        if normalize_heading(heading) == wanted:
+            return heading, body
+    for heading, body in sections.items():
+        if normalize_heading(heading).startswith(wanted) or wanted.startswith(normalize_heading(heading)):
+            return heading, body
+    for heading, body in sections.items():
+        if f" {wanted} " in f" {normalize_heading(heading)} ":
+            return heading, body
+    return None, None
+
+
+def split_exercises(body: str) -> list:
+    """Splits an Exercises body into one block per exercise.
+
+    Exercises are grouped by their ``###`` sub-headings, each block keeping its
+    heading, instructions and items; any text before the first sub-heading goes
+    with the first exercise. A body without sub-headings is split per top-level
+    numbered or bulleted item instead.
+    """
+    lines = body.split("\n")
+    if any(SUBHEADING_RE.match(line) for line in lines):
+        items, current, has_text = [], [], False
+        for line in lines:
+            if SUBHEADING_RE.match(line):
+                # Consecutive sub-headings (e.g. a ### group over #### exercises) stay together
+                if has_text and any(SUBHEADING_RE.match(part) for part in current):
+                    items.append("\n".join(current).strip())
+                    current, has_text = [], False
+            elif line.strip():
+                has_text = True
+            current.append(line)
+        items.append("\n".join(current).strip())
+        return [item for item in items if item]
+
+    items, current = [], []
+    for line in lines:
+        if EXERCISE_RE.match(line) and not line.startswith((" ", "\t")):
+            if current:
+                items.append("\n".join(current).strip())
+            current = [line]
+        elif current:
+            current.append(line)
+    if current:
+        items.append("\n".join(current).strip())
+    return items
+
+
+def is_table_separator(line: str) -> bool:
+    return bool(TABLE_SEPARATOR_RE.match(line.strip()))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + "\n…"
+
+
+def first_line(text: str, max_chars: int = 160) -> str:
+    for line in text.split("\n"):
+        line = line.strip()
+        if line:
+            return line if len(line) <= max_chars else line[:max_chars].rstrip() + "…"
+    return ""
+
+
+def lesson_summary(sections: dict) -> str:
+    """A few lines describing the lesson: objective, key vocabulary and badge."""
+    lines = []
+    _, welcome = find_section(sections, "Welcome")
+    if welcome:
+        lines.append(f"Objective: {first_line(welcome)}")
+    _, vocabulary = find_section(sections, "Vocabulary")
+    if vocabulary:
+        words = []
+        for row in vocabulary.split("\n"):
+            cells = [cell.strip() for cell in row.strip().strip("|").split("|")]
+            if row.strip().startswith("|") and not is_table_separator(row) and cells[0]:
+                words.append(cells[0].strip("*"))
+        if len(words) > 1:
+            lines.append(f"Vocabulary: {', '.join(words[1:])}")
+    _, badge = find_section(sections, "Badge")
+    if badge:
+        lines.append(f"Badge: {first_line(badge)}")
+    return "\n".join(lines)
+
+
+def build_answer_context(class_plan: str, section: str = None, exercise: int = None, max_tokens: int = 800) -> str:
+    """Picks the part of a lesson a student answer relates to, within ``max_tokens``.
+
+    Returns the requested section (or a single exercise of it) after a compact
+    lesson summary. Without a section, or when the section can't be found, the
+    whole plan is used, truncated to the budget.
+    """
+    sections = split_sections(class_plan)
+    heading, body = find_section(sections, section) if section else (None, None)
+    if heading is None:
+        return truncate_to_tokens(class_plan.strip(), max_tokens)
+
+    if exercise is not None:
+        items = split_exercises(body)
+        if 0 < exercise <= len(items):
+            body = items[exercise - 1]
+            heading = f"{heading} (exercise {exercise})"
+
+    summary = lesson_summary(sections)
+    focus = f"## {heading}\n{body}"
+    focus_budget = max_tokens - estimate_tokens(summary)
+    if focus_budget < max_tokens // 2:
+        summary = truncate_to_tokens(summary, max_tokens // 4)
+        focus_budget = max_tokens - estimate_tokens(summary)
+    focus = truncate_to_tokens(focus, focus_budget)
+    return f"Lesson summary:\n{summary}\n\n{focus}" if summary else focus
+
+
+QUICK_CHECK_ITEM_RE = re.compile(r"^\s*[-*]\s+\[\s*\]\s+(.+)$")
+CATEGORY_RE = re.compile(r"^\s*(?:#{3,}\s+(.+?)|\*\*([^*]+?)\*\*:?)\s*$")
+LINK_RE = re.compile(r"\[([^\]]+)\]\((https?://[^)\s]+)\)")
+BADGE_RE = re.compile(r"\*\*(.+?)\*\*")
+
+
+def table_rows(body: str) -> list:
+    rows = []
+    for line in body.split("\n"):
+        line = line.strip()
+        if not line.startswith("|") or re.match(r"^\|[\s:|-]+\|?$", line):
+            continue
+        rows.append([cell.strip() for cell in line.strip("|").split("|")])
+    return rows
+
+
+def parse_quick_check(body: str) -> dict:
+    """Drag-and-drop items, flat and grouped under the category each answers.
+
+    ``categories`` is a list of ``{"name", "items"}`` in lesson order; items
+    listed before any category heading go under a ``None`` name.
+    """
+    items, categories = [], []
+    for line in body.split("\n"):
+        item = QUICK_CHECK_ITEM_RE.match(line)
+        if item:
+            text = item.group(1).strip()
+            items.append(text)
+            if not categories:
+                categories.append({"name": None, "items": []})
+            categories[-1]["items"].append(text)
+            continue
+        category = CATEGORY_RE.match(line)
+        if category:
+            categories.append({"name": (category.group(1) or category.group(2)).strip(), "items": []})
+    # Bold lines that head no items (instructions, tips) are not categories
+    return {"items": items, "categories": [category for category in categories if category["items"]]}
+
+
+def parse_vocabulary(body: str) -> list:
+    words = []
+    for cells in table_rows(body)[1:]:
+        cells += [""] * (3 - len(cells))
+        word, meaning, example = cells[0].strip("*"), cells[1], cells[2]
+        if word:
+            words.append({"word": word, "meaning": meaning, "example": example})
+    return words
+
+
+def strip_rules(body: str) -> str:
+    return re.sub(r"(?:\n\s*-{3,}\s*)+$", "", body).strip()
+
+
+def parse_lesson(class_plan: str) -> dict:
+    """Parses a lesson once into the typed structure the frontend renders.
+
+    Quick Check, Vocabulary and Exercises come back as data. Every other
+    section, and any of those three that yielded no data, keeps its markdown.
+    """
+    lesson = {
+        "title": "",
+        "intro": "",
+        "sections": [],
+        "quick_check": {"items": [], "categories": []},
+        "vocabulary": [],
+        "exercises": [],
+        "video": None,
+        "badge": None,
+    }
+    preamble = class_plan.lstrip()
+    preamble = "" if HEADING_RE.match(preamble.split("\n", 1)[0]) else preamble.split("\n## ", 1)[0]
+    if preamble.startswith("# "):
+        title, _, preamble = preamble.partition("\n")
+        lesson["title"] = title[2:].strip()
+    lesson["intro"] = strip_rules(preamble)
+
+    for heading, body in split_sections(class_plan).items():
+        body = strip_rules(body)
+        name = normalize_heading(heading)
+        if name.startswith("quick check"):
+            lesson["quick_check"] = parse_quick_check(body)
+            if lesson["quick_check"]["items"]:
+                continue
+        elif name.startswith("vocabulary"):
+            lesson["vocabulary"] = parse_vocabulary(body)
+            if lesson["vocabulary"]:
+                continue
+        elif "exercises" in name.split():
+            lesson["exercises"] = split_exercises(body)
+            if name == "exercises" and lesson["exercises"]:
+                continue
+        elif lesson["video"] is None and "video" in name.split():
+            link = LINK_RE.search(body)
+            if link:
+                lesson["video"] = {"title": link.group(1), "url": link.group(2)}
+        elif lesson["badge"] is None and "badge" in name.split():
+            badge = BADGE_RE.search(body)
+            lesson["badge"] = badge.group(1).strip() if badge else first_line(body)
+        lesson["sections"].append({"heading": heading, "content": body})
+    return lesson
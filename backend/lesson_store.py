@@ -0,0 +1,95 @@
+# backend/lesson_store.py
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+
+from metrics import REDIS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class LessonStore:
+    """Server-side copy of generated lessons, addressed by ``lesson_id``.
+
+    Lessons are written to Redis with a TTL so any worker can serve them, and
+    kept in a bounded in-process LRU so repeat lookups skip the round-trip.
+    With a ``database`` (see database.py) every lesson is also written through
+    to durable storage, which serves lookups once the Redis copy has expired.
+    """
+
+    def __init__(self, redis_client, ttl: int = 30 * 86400, max_local: int = 1000, database=None):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_local = max_local
+        self.database = database
+        self._local = OrderedDict()
+
+    @staticmethod
+    def _key(lesson_id: str) -> str:
+        return f"lesson:{lesson_id}"
+
+    def _remember(self, lesson_id: str, lesson: dict):
+        self._local[lesson_id] = lesson
+        self._local.move_to_end(lesson_id)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+
+    async def save(self, user_id: str, class_plan: str, **meta) -> str:
+        lesson_id = uuid.uuid4().hex
+        lesson = {"user_id": user_id, "class_plan": class_plan, "created_at": time.time(), **meta}
+        self._remember(lesson_id, lesson)
+        if self.redis_client:
+            try:
+                await self.redis_client.set(self._key(lesson_id), json.dumps(lesson), ex=self.ttl)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="lesson_store")
+                logger.warning("Could not persist lesson %s to Redis: %s", lesson_id, e)
+        if self.database:
+            # The structured form is derived from the text, so only the text is kept.
+            durable = {key: value for key, value in meta.items() if key != "structured"}
+            try:
+                await asyncio.to_thread(
+                    self.database.save, lesson_id, user_id, class_plan, lesson["created_at"], **durable
+                )
+            except sqlite3.Error as e:
+                logger.warning("Could not write lesson %s to the database: %s", lesson_id, e)
+        return lesson_id
+
+    async def get(self, lesson_id: str):
+        lesson = self._local.get(lesson_id)
+        if lesson is not None:
+            self._local.move_to_end(lesson_id)
+            return lesson
+        if self.redis_client:
+            try:
+                raw = await self.redis_client.get(self._key(lesson_id))
+            except redis.exceptions.RedisError as e:
+                # Fall through to the database, which outlives Redis.
+                REDIS_ERRORS.inc(operation="lesson_store")
+                logger.warning("Could not load lesson %s from Redis: %s", lesson_id, e)
+                raw = None
+            if raw:
+                lesson = json.loads(raw)
+                self._remember(lesson_id, lesson)
+                return lesson
+        if self.database:
+            try:
+                lesson = await asyncio.to_thread(self.database.get, lesson_id)
+            except sqlite3.Error as e:
+                logger.warning("Could not load lesson %s from the database: %s", lesson_id, e)
+                return None
+            if lesson:
+                self._remember(lesson_id, lesson)
+                return lesson
+        return None
+
+    async def history(self, user_id: str, limit: int = 20, before: float = None) -> list:
+        if not self.database:
+            return []
+        return await asyncio.to_thread(self.database.history, user_id, limit, before)
@@ -1,30 +1,113 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
-from firebase_admin import credentials, auth, initialize_app
 import httpx
 import os
 import logging
 import redis
+import redis.asyncio as aioredis
 from datetime import date, datetime, timedelta
 import json
-import bleach
-import time
+from typing import Optional
+import asyncio
+import threading
 import re
-from starlette.requests import Request
-from starlette.responses import JSONResponse
+import random
+import hashlib
+import hmac
+from starlette.responses import JSONResponse, PlainTextResponse
+from access_log import AccessMiddleware, configure_logging
+from auth_cache import TokenCache
+from streaming import ClosingStreamingResponse, IncrementalSanitizer, close_stream, sse_event
+from sanitizer import BASIC_FORMATTING, LESSON_MARKUP, STRIP_ALL
+from lesson_pool import LessonPool
+from singleflight import SingleFlight
+from lesson_store import LessonStore
+from database import LessonDatabase, DEFAULT_PATH as LESSON_DB_PATH
+from lesson_sections import build_answer_context, is_table_separator, parse_lesson
+from lesson_cache import LessonCache, cache_params
+from routing import DEFAULT_CONFIG_PATH as ROUTING_CONFIG_PATH, Route, Router
+from batch import DEFAULT_TIMEOUT as BATCH_TIMEOUT, LocalBatchBackend, OpenAIBatchBackend, batch_line, run_batch, wait_for_batch
+from jobs import FINISHED, QUEUED, JobQueueFullError, JobRunner, JobStore, new_job_id, public_view
+from prompts import feedback_prompt, lesson_prompt
+from used_items import PHRASES, VOCAB, UsedItems
+from openai_scheduler import OpenAIScheduler, QueueFullError
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, hedged
+from cassette import REPLAY as CASSETTE_REPLAY, cassette_from_env
+from startup import ERROR as STARTUP_ERROR, OK as STARTUP_OK, report as startup_report, warm_up
+from fallback_limits import FallbackLimitStore, DEFAULT_PATH as FALLBACK_LIMITS_PATH
+from metrics import (
+    FALLBACK_LIMITER, LESSONS_SERVED, OPENAI_IN_FLIGHT, OPENAI_QUEUED, OPENAI_REQUESTS, OPENAI_TOKENS,
+    REDIS_ERRORS, ROUTE_TOKENS, STAGE_SECONDS, render_metrics,
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queue-based; records are formatted off the request path)
+configure_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Startup and shutdown. Imports and client construction are kept cheap; the
+# slow parts (Redis TLS handshake, Firebase setup and certs, the first OpenAI
+# connection) run here concurrently, each bounded by STARTUP_STEP_TIMEOUT, and
+# a dependency that is down is reported instead of holding up the worker.
+# The clients, stores and runners it uses are defined further down; they are
+# looked up when the app starts, after this module has finished importing.
+STARTUP_STEP_TIMEOUT = float(os.getenv("STARTUP_STEP_TIMEOUT", 5))
+
+async def warm_redis():
+    await redis_client.ping()
+
+async def warm_firebase():
+    await token_cache.warm_certs()
+
+async def warm_openai():
+    # Opens a pooled connection (DNS, TLS) so the first lesson doesn't pay for it
+    await get_openai_client().models.list()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    steps = {"firebase": warm_firebase}
+    if redis_client:
+        steps["redis"] = warm_redis
+    if not (openai_cassette and openai_cassette.mode == CASSETTE_REPLAY):
+        steps["openai"] = warm_openai
+    results = await warm_up(steps, timeout=STARTUP_STEP_TIMEOUT)
+    if results["firebase"]["status"] == STARTUP_ERROR and not firebase_initialized:
+        raise RuntimeError("Firebase initialization failed.")
+    if "redis" in results and results["redis"]["status"] != STARTUP_OK:
+        logger.warning("Could not connect to Redis. Falling back to local rate limiting.")
+    token_cache.start_cert_refresh(
+        float(os.getenv("FIREBASE_CERT_REFRESH_SECONDS", 3600)),
+        refresh_now=results["firebase"]["status"] != STARTUP_OK,
+    )
+    # Picks up jobs left unfinished by a previous worker
+    job_runner.start()
+    batch_jobs.start()
+    logger.info(startup_report(started - IMPORT_STARTED, results, time.perf_counter() - IMPORT_STARTED))
+    yield
+    await lesson_pool.close()
+    await job_runner.close()
+    await batch_jobs.close()
+    await token_cache.close()
+    if openai_client is not None:
+        await openai_client.close()
+        logger.info("HTTP client closed on shutdown.")
+    if redis_client:
+        await redis_client.aclose()
+        await redis_pool.disconnect()
+        logger.info("Redis connection pool closed on shutdown.")
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -39,16 +122,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Debug middleware to log headers
-@app.middleware("http")
-async def log_headers(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
-    logger.info(f"Request headers: {dict(request.headers)}")
-    response = await call_next(request)
-    logger.info(f"Response headers: {dict(response.headers)}")
-    return response
+# Structured access log with sampled, redacted headers, plus the request
+# latency histograms and in-flight gauge exposed on /metrics
+app.add_middleware(AccessMiddleware)
 
-# Initialize Firebase Admin SDK
+# Firebase Admin SDK credentials (the SDK itself is imported and initialized
+# on first use, normally during startup warm-up)
 firebase_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
 if not firebase_json:
     logger.error("FIREBASE_SERVICE_ACCOUNT_JSON environment variable not set.")
@@ -56,53 +135,119 @@ if not firebase_json:
 
 try:
     firebase_credentials_dict = json.loads(firebase_json)
-    cred = credentials.Certificate(firebase_credentials_dict)
-    initialize_app(cred)
-    logger.info("Firebase initialized from environment variable.")
-except Exception as e:
-    logger.error(f"Firebase initialization failed: {e}")
+except ValueError as e:
+    logger.error("Firebase credentials are not valid JSON: %s", e)
     raise SystemExit("Firebase initialization failed.")
 
-# Initialize OpenAI client
+firebase_initialized = False
+firebase_lock = threading.Lock()
+
+def init_firebase():
+    """Initializes the default Firebase app once; safe to call from any thread."""
+    global firebase_initialized
+    if firebase_initialized:
+        return
+    with firebase_lock:
+        if firebase_initialized:
+            return
+        import firebase_admin
+        from firebase_admin import credentials
+
+        try:
+            firebase_admin.initialize_app(credentials.Certificate(firebase_credentials_dict))
+        except Exception as e:
+            logger.error("Firebase initialization failed: %s", e)
+            raise RuntimeError("Firebase initialization failed.") from e
+        firebase_initialized = True
+        logger.info("Firebase initialized from environment variable.")
+
+# OpenAI API key (the client is built on first use)
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     logger.error("OPENAI_API_KEY not set.")
     raise ValueError("OPENAI_API_KEY not set.")
 
-# HTTPX async client for OpenAI
-http_client = httpx.AsyncClient(
-    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
-    timeout=30.0,
-    follow_redirects=True,
-)
-client = AsyncOpenAI(api_key=openai_api_key, http_client=http_client)
+openai_client = None
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    await http_client.aclose()
-    logger.info("HTTP client closed on shutdown.")
+def get_openai_client():
+    global openai_client
+    if openai_client is None:
+        from openai import AsyncOpenAI
 
-# Initialize Redis client
-redis_client = None
-try:
-    if os.getenv("REDIS_URL"):
-        redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
-    else:
-        redis_client = redis.Redis(
-            host=os.getenv("REDIS_HOST", "localhost"),
-            port=int(os.getenv("REDIS_PORT", 6379)),
-            username=os.getenv("REDIS_USERNAME", "default"),
-            password=os.getenv("REDIS_PASSWORD"),
-            decode_responses=True,
-            ssl=True,
+        # HTTPX async client for OpenAI
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=30.0,
+            follow_redirects=True,
         )
-    redis_client.ping()
-    logger.info("Successfully connected to Redis.")
-except redis.exceptions.ConnectionError as e:
-    logger.warning(f"Could not connect to Redis: {e}. Falling back to in-memory rate limiting.")
+        openai_client = AsyncOpenAI(api_key=openai_api_key, http_client=http_client)
+    return openai_client
+
+# Cache of verified Firebase ID tokens
+token_cache = TokenCache(
+    max_size=int(os.getenv("TOKEN_CACHE_SIZE", 10000)),
+    verify_workers=int(os.getenv("TOKEN_VERIFY_WORKERS", 4)),
+    initialize=init_firebase,
+)
 
-# In-memory fallback for rate limiting
-fallback_limits = {}
+# Initialize Redis client (asyncio, pooled). Short socket timeouts turn a
+# Redis that accepts connections but never answers into a RedisError, so
+# quota checks fail over to fallback_limits instead of hanging.
+REDIS_TIMEOUTS = {
+    "socket_connect_timeout": float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0)),
+    "socket_timeout": float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5)),
+}
+if os.getenv("REDIS_URL"):
+    redis_pool = aioredis.ConnectionPool.from_url(
+        os.getenv("REDIS_URL"),
+        decode_responses=True,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+        **REDIS_TIMEOUTS,
+    )
+else:
+    redis_pool = aioredis.ConnectionPool(
+        connection_class=aioredis.SSLConnection,
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        username=os.getenv("REDIS_USERNAME", "default"),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=True,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+        **REDIS_TIMEOUTS,
+    )
+# Always set in production. The `if redis_client:` checks below are for the
+# benchmark harness, where BENCH_REDIS=none sets it to None to exercise the
+# in-process fallbacks (see bench/stub_app.py).
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# All of a user's quota counters for one day live in a single hash,
+# quota:{user}:{date}, with one field per endpoint.
+# Checks the endpoint's counter, adds the cost and sets the expiry in one
+# round-trip. Returns the new call count, or -1 when the limit would be exceeded.
+RATE_LIMIT_SCRIPT = """
+local calls = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local cost = tonumber(ARGV[4])
+if calls + cost > tonumber(ARGV[2]) then
+    return -1
+end
+calls = redis.call('HINCRBY', KEYS[1], ARGV[1], cost)
+redis.call('EXPIREAT', KEYS[1], ARGV[3])
+return calls
+"""
+rate_limit_script = redis_client.register_script(RATE_LIMIT_SCRIPT)
+
+# Fallback for rate limiting while Redis is down, shared by all workers on the host
+fallback_limits = FallbackLimitStore(
+    os.getenv("FALLBACK_LIMITS_PATH", FALLBACK_LIMITS_PATH),
+    max_rows=int(os.getenv("FALLBACK_LIMITS_MAX_ROWS", 100000)),
+)
+
+# Daily call limits per tier and endpoint
+QUOTA_ENDPOINTS = ("generate", "submit")
+DAILY_LIMITS = {
+    "free": {endpoint: int(os.getenv("FREE_DAILY_LIMIT", 5)) for endpoint in QUOTA_ENDPOINTS},
+    "premium": {endpoint: int(os.getenv("PREMIUM_DAILY_LIMIT", 50)) for endpoint in QUOTA_ENDPOINTS},
+}
 
 # Authentication Dependency
 async def get_current_user(authorization: str = Header(None)):
@@ -115,10 +260,12 @@ async def get_current_user(authorization: str = Header(None)):
         )
     token = authorization.split(" ")[1]
     try:
-        decoded = auth.verify_id_token(token)
-        return {"user_id": decoded["uid"]}
+        with STAGE_SECONDS.time(stage="auth_verify"):
+            decoded = await token_cache.verify(token)
+        tier = "premium" if decoded.get("premium") or decoded.get("tier") == "premium" else "free"
+        return {"user_id": decoded["uid"], "tier": tier}
     except Exception as e:
-        logger.error(f"Token verification failed: {e}")
+        logger.error("Token verification failed: %s", e)
         raise HTTPException(
             status_code=401,
             detail="Invalid or expired token",
@@ -126,42 +273,73 @@ async def get_current_user(authorization: str = Header(None)):
         )
 
 # Rate Limiting Function
-def check_api_limit(user_id: str, endpoint: str) -> int:
-    today = date.today().isoformat()
-    key = f"{endpoint}_calls:{user_id}:{today}"
-    max_calls_per_day = 5
+def quota_key(user_id: str) -> str:
+    return f"quota:{user_id}:{date.today().isoformat()}"
 
+def quota_expiry() -> int:
+    next_day = datetime.utcnow().date() + timedelta(days=1)
+    return int(datetime.combine(next_day, datetime.min.time()).timestamp())
+
+async def get_quota_usage(user_id: str) -> dict:
+    key = quota_key(user_id)
     if redis_client:
         try:
-            calls = redis_client.get(key)
-            calls = int(calls) if calls else 0
+            usage = await redis_client.hgetall(key)
+            return {endpoint: int(calls) for endpoint, calls in usage.items()}
         except redis.exceptions.RedisError:
-            logger.warning(f"Redis unavailable, using fallback for {key}")
-            calls = fallback_limits.get(key, 0)
-    else:
-        calls = fallback_limits.get(key, 0)
+            REDIS_ERRORS.inc(operation="quota")
+            logger.warning("Redis unavailable, using fallback for %s", key)
+    FALLBACK_LIMITER.inc(operation="usage")
+    return await asyncio.to_thread(fallback_limits.usage, user_id)
 
-    if calls >= max_calls_per_day:
+def remaining_quota(usage: dict, tier: str) -> dict:
+    return {
+        endpoint: max(0, limit - usage.get(endpoint, 0))
+        for endpoint, limit in DAILY_LIMITS[tier].items()
+    }
+
+async def check_api_limit(user_id: str, endpoint: str, tier: str = "free", cost: int = 1) -> int:
+    key = quota_key(user_id)
+    max_calls_per_day = DAILY_LIMITS[tier][endpoint]
+
+    calls = None
+    with STAGE_SECONDS.time(stage="rate_limit"):
+        if redis_client:
+            try:
+                calls = int(await rate_limit_script(keys=[key], args=[endpoint, max_calls_per_day, quota_expiry(), cost]))
+            except redis.exceptions.RedisError:
+                REDIS_ERRORS.inc(operation="rate_limit")
+                logger.warning("Redis unavailable, using fallback for %s", key)
+
+        if calls is None:
+            FALLBACK_LIMITER.inc(operation="increment")
+            calls = await asyncio.to_thread(fallback_limits.increment, user_id, endpoint, max_calls_per_day, cost)
+
+    if calls < 0:
         raise HTTPException(
             status_code=429,
             detail=f"Daily {endpoint} limit ({max_calls_per_day}) reached. Try again tomorrow or upgrade to premium!",
             headers={"X-Remaining-Calls": "0"},
         )
 
+    return max_calls_per_day - calls
+
+async def refund_api_limit(user_id: str, endpoint: str, cost: int = 1):
+    """Returns ``cost`` calls charged by check_api_limit for work that was never queued."""
     if redis_client:
         try:
-            redis_client.incr(key)
-            next_day = datetime.utcnow().date() + timedelta(days=1)
-            expire_time = int(datetime.combine(next_day, datetime.min.time()).timestamp())
-            redis_client.expireat(key, expire_time)
+            await redis_client.hincrby(quota_key(user_id), endpoint, -cost)
+            return
         except redis.exceptions.RedisError:
-            fallback_limits[key] = fallback_limits.get(key, 0) + 1
-    else:
-        fallback_limits[key] = fallback_limits.get(key, 0) + 1
-
-    return max_calls_per_day - (calls + 1)
+            REDIS_ERRORS.inc(operation="rate_limit")
+            logger.warning("Redis unavailable, refunding %s call(s) to the fallback for %s", cost, user_id)
+    FALLBACK_LIMITER.inc(operation="refund")
+    await asyncio.to_thread(fallback_limits.refund, user_id, endpoint, cost)
 
 # Pydantic Models
+# Most entries accepted from a client's used_phrases / used_vocab per request
+MAX_USED_ITEMS_PER_REQUEST = 500
+
 class ClassRequest(BaseModel):
     student_level: str = Field(..., pattern="^(A1|A2|B1|B2|C1|C2)$")
     skill_focus: str = Field(..., pattern="^(Speaking|Grammar|Vocabulary|Writing|Reading)$")
@@ -174,18 +352,358 @@ class ClassRequest(BaseModel):
 
     @validator("reason")
     def sanitize_reason(cls, v):
-        return bleach.clean(v, tags=[], strip=True)
+        return STRIP_ALL.clean(v)
+
+    @validator("used_phrases", "used_vocab")
+    def cap_used_items(cls, v):
+        # History is kept server-side now; only the newest entries are merged in.
+        return v[-MAX_USED_ITEMS_PER_REQUEST:]
 
 class AnswerRequest(BaseModel):
     answer: str
-    class_plan: str
+    class_plan: str = ""
+    lesson_id: Optional[str] = Field(default=None, pattern="^[0-9a-f]{32}$")
+    section: Optional[str] = Field(default=None, max_length=100)
+    exercise: Optional[int] = Field(default=None, ge=1, le=50)
     student_level: str = Field(..., pattern="^(A1|A2|B1|B2|C1|C2)$")
     skill_focus: str = Field(..., pattern="^(Speaking|Grammar|Vocabulary|Writing|Reading)$")
     reason: str
 
     @validator("reason", "answer", "class_plan")
     def sanitize_inputs(cls, v):
-        return bleach.clean(v, tags=["b", "strong", "i", "em"], strip=True)
+        return BASIC_FORMATTING.clean(v)
+
+def class_request_fields(req: ClassRequest) -> dict:
+    return {
+        "level": req.student_level,
+        "skill": req.skill_focus,
+        "teacher": req.teacher,
+        "reason": req.reason,
+        "age": req.age,
+        "module_lesson": req.module_lesson,
+        "used_phrases": len(req.used_phrases),
+        "used_vocab": len(req.used_vocab),
+    }
+
+# Output Helpers
+def sanitize_class_plan(text: str) -> str:
+    return LESSON_MARKUP.clean(text)
+
+def extract_badge(class_plan: str) -> str:
+    badge_match = re.search(r"🏅\s*\*\*(.*?)\*\*", class_plan)
+    return badge_match.group(1) if badge_match else "Language Learner"
+
+def shuffle_section_lines(class_plan: str, heading: str, is_item, rng: random.Random, keep_first: bool = False) -> str:
+    # Items only move within their own block: any other non-blank line (such
+    # as a Quick Check category heading) starts a new one, so answers stay
+    # under the category they belong to.
+    def shuffle(match):
+        lines = match.group(2).split("\n")
+        blocks, block = [], []
+        for i, line in enumerate(lines):
+            if is_item(line):
+                block.append(i)
+            elif line.strip() and block:
+                blocks.append(block)
+                block = []
+        blocks.append(block)
+        if keep_first:
+            blocks[0] = blocks[0][1:]
+        for positions in blocks:
+            items = [lines[i] for i in positions]
+            rng.shuffle(items)
+            for i, item in zip(positions, items):
+                lines[i] = item
+        return match.group(1) + "\n".join(lines)
+    return re.sub(rf"(## {heading}\n)([\s\S]*?)(?=\n##|$)", shuffle, class_plan, count=1)
+
+def vary_lesson(class_plan: str, user_id: str) -> str:
+    # Lessons shared between concurrent identical requests are reshuffled per
+    # user so a classroom doesn't see the same drag-and-drop and word order.
+    rng = random.Random(user_id)
+    class_plan = shuffle_section_lines(
+        class_plan, "Quick Check", lambda line: re.match(r"- \[\s*\] ", line), rng
+    )
+    return shuffle_section_lines(
+        class_plan, "Vocabulary", lambda line: line.startswith("|") and not is_table_separator(line), rng, keep_first=True
+    )
+
+def drop_table_rows(class_plan: str, heading: str, words: set) -> str:
+    def drop(match):
+        lines = [
+            line for line in match.group(2).split("\n")
+            if not (line.startswith("|") and line.strip("|").split("|")[0].strip().strip("*") in words)
+        ]
+        return match.group(1) + "\n".join(lines)
+    return re.sub(rf"(## {heading}\n)([\s\S]*?)(?=\n##|$)", drop, class_plan, count=1)
+
+def raise_openai_error(user_id: str, e: Exception):
+    if isinstance(e, QueueFullError):
+        logger.warning("User %s - OpenAI queue full", user_id)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    if isinstance(e, CircuitOpenError):
+        logger.warning("User %s - OpenAI circuit open", user_id)
+        raise HTTPException(status_code=503, detail=f"{e} Try again later.", headers={"Retry-After": "30"})
+    logger.error("User %s - OpenAI error: %s", user_id, e)
+    if "rate_limit" in str(e).lower():
+        raise HTTPException(status_code=429, detail="OpenAI rate limit exceeded. Try again later.")
+    raise HTTPException(status_code=503, detail=f"OpenAI service unavailable: {str(e)}")
+
+# OpenAI Completions
+# OPENAI_CASSETTE records completions to, or replays them from, a local file
+openai_cassette = cassette_from_env()
+
+async def openai_create(**params):
+    if openai_cassette:
+        return await openai_cassette.create(get_openai_client().chat.completions.create, **params)
+    return await get_openai_client().chat.completions.create(**params)
+
+# Every upstream call is admitted through the scheduler, which queues per user
+# and caps global concurrency and tokens per minute.
+openai_scheduler = OpenAIScheduler(
+    max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", 32)),
+    tokens_per_minute=int(os.getenv("OPENAI_TPM_LIMIT", 0)),
+    max_queue=int(os.getenv("OPENAI_MAX_QUEUE", 500)),
+    max_queue_per_user=int(os.getenv("OPENAI_MAX_QUEUE_PER_USER", 5)),
+)
+
+# Model, max_tokens and temperature per endpoint, level, skill and tier
+router = Router.from_file(os.getenv("ROUTING_CONFIG", ROUTING_CONFIG_PATH))
+
+# Stops sending traffic upstream while OpenAI is failing or hanging
+openai_breaker = CircuitBreaker(
+    "OpenAI",
+    failure_ratio=float(os.getenv("OPENAI_BREAKER_FAILURE_RATIO", 0.5)),
+    min_calls=int(os.getenv("OPENAI_BREAKER_MIN_CALLS", 10)),
+    slow_call_seconds=float(os.getenv("OPENAI_BREAKER_SLOW_SECONDS", 20)),
+    open_seconds=float(os.getenv("OPENAI_BREAKER_OPEN_SECONDS", 30)),
+    timeout=float(os.getenv("OPENAI_CALL_TIMEOUT", 45)),
+)
+
+# Optional hedging for feedback calls: a second attempt is fired once the
+# first runs past the recent p95 latency.
+HEDGE_FEEDBACK = os.getenv("OPENAI_HEDGE_FEEDBACK", "0") == "1"
+feedback_latency = LatencyTracker()
+
+def estimate_request_tokens(messages: list, expected_output_tokens: int) -> int:
+    return sum(len(m["content"]) for m in messages) // 4 + expected_output_tokens
+
+def record_usage(usage):
+    if usage:
+        OPENAI_TOKENS.inc(usage.prompt_tokens, type="prompt")
+        OPENAI_TOKENS.inc(usage.completion_tokens, type="completion")
+
+def record_openai_outcome(e: Exception):
+    if isinstance(e, (CircuitOpenError, QueueFullError)):
+        OPENAI_REQUESTS.inc(outcome="rejected")
+    elif isinstance(e, asyncio.TimeoutError):
+        OPENAI_REQUESTS.inc(outcome="timeout")
+    else:
+        OPENAI_REQUESTS.inc(outcome="error")
+
+async def create_completion(user_id: str, messages: list, route: Route, *, priority: bool = False, **params):
+    params = {**route.params(), **params}
+
+    async def call():
+        started = time.perf_counter()
+        response = await openai_create(messages=messages, **params)
+        finish_reason = response.choices[0].finish_reason if response.choices else None
+        route.record(response.usage, time.perf_counter() - started, finish_reason)
+        return response
+
+    try:
+        with STAGE_SECONDS.time(stage="openai_wait"):
+            openai_breaker.check()
+            response = await openai_scheduler.run(
+                user_id,
+                lambda: openai_breaker.call(call),
+                priority=priority,
+                estimated_tokens=estimate_request_tokens(messages, params["max_tokens"]),
+            )
+    except Exception as e:
+        record_openai_outcome(e)
+        raise
+    OPENAI_REQUESTS.inc(outcome="ok")
+    record_usage(response.usage)
+    return response
+
+async def create_feedback_completion(user_id: str, messages: list, route: Route, **params):
+    async def attempt():
+        return await create_completion(user_id, messages, route, priority=True, **params)
+
+    start_time = time.time()
+    delay = feedback_latency.percentile(95) if HEDGE_FEEDBACK else None
+    response = await (hedged(attempt, delay) if delay else attempt())
+    feedback_latency.record(time.time() - start_time)
+    return response
+
+async def stream_completion(user_id: str, messages: list, route: Route, *, priority: bool = False, **params):
+    # The scheduler slot is held until the stream is exhausted or closed.
+    params = {**route.params(), **params}
+    started = time.perf_counter()
+    try:
+        with STAGE_SECONDS.time(stage="openai_wait"):
+            openai_breaker.check()
+            ticket = await openai_scheduler.acquire(
+                user_id, priority, estimate_request_tokens(messages, params["max_tokens"])
+            )
+            try:
+                stream = await openai_breaker.call(lambda: openai_create(
+                    messages=messages, stream=True, stream_options={"include_usage": True}, **params
+                ))
+            except BaseException:
+                openai_scheduler.release(ticket)
+                raise
+    except Exception as e:
+        record_openai_outcome(e)
+        raise
+
+    async def chunks():
+        outcome, usage, finish_reason = "error", None, None
+        try:
+            async for chunk in stream:
+                # With include_usage the final chunk carries usage and no choices.
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                yield chunk
+            outcome = "ok"
+        finally:
+            # Closing the upstream response stops generation (and billing) when
+            # the client went away before the end.
+            try:
+                await close_stream(stream)
+            finally:
+                OPENAI_REQUESTS.inc(outcome=outcome)
+                record_usage(usage)
+                route.record(usage, time.perf_counter() - started, finish_reason)
+                openai_scheduler.release(ticket)
+
+    return chunks()
+
+# Lesson Generation
+# Identical prompts in flight at the same time share one OpenAI call
+lesson_flights = SingleFlight()
+
+async def generate_lesson_plan(req: ClassRequest, user_id: str, avoid: dict = None, tier: str = "free"):
+    avoid = avoid or {}
+    route = router.route("lesson", req.student_level, req.skill_focus, tier)
+    with STAGE_SECONDS.time(stage="prompt_build"):
+        prompt = lesson_prompt(req, avoid.get(PHRASES), avoid.get(VOCAB))
+
+    async def complete():
+        response = await create_completion(user_id, [{"role": "user", "content": prompt}], route)
+        class_plan = response.choices[0].message.content or "No lesson plan generated."
+        with STAGE_SECONDS.time(stage="sanitize"):
+            class_plan = sanitize_class_plan(class_plan)
+        cache_lesson(req, class_plan)
+        return class_plan
+
+    key = hashlib.sha256(f"{route.name}\n{prompt.strip()}".encode("utf-8")).hexdigest()
+    return await lesson_flights.do(key, complete)
+
+async def generate_pooled_lesson(params: dict) -> str:
+    params = dict(params)
+    tier = params.pop("tier")
+    class_plan, _ = await generate_lesson_plan(ClassRequest(**params), "lesson-pool", tier=tier)
+    return class_plan
+
+# Pool of pre-generated lessons keyed by request parameters
+lesson_pool = LessonPool(
+    redis_client,
+    generate_pooled_lesson,
+    size=int(os.getenv("LESSON_POOL_SIZE", 2)),
+    max_refills=int(os.getenv("LESSON_POOL_MAX_REFILLS", 4)),
+    low_water=int(os.getenv("LESSON_POOL_LOW_WATER", 1)),
+    refills_per_hour=int(os.getenv("LESSON_POOL_REFILLS_PER_HOUR", 60)),
+)
+
+# Token budget for the lesson excerpt included in submit-answer prompts
+SUBMIT_CONTEXT_TOKEN_BUDGET = int(os.getenv("SUBMIT_CONTEXT_TOKEN_BUDGET", 1200))
+
+# Server-side copies of generated lessons, referenced by lesson_id
+# Durable lesson history; Redis holds the recent copies
+lesson_db = LessonDatabase(os.getenv("LESSON_DB_PATH", LESSON_DB_PATH))
+lesson_store = LessonStore(redis_client, ttl=int(os.getenv("LESSON_TTL_SECONDS", 30 * 86400)), database=lesson_db)
+
+# Phrases and vocabulary each learner has already seen. The full history is a
+# hashed set per user; only the most recent items go into prompts.
+used_items = UsedItems(
+    redis_client,
+    max_items=int(os.getenv("USED_ITEMS_MAX", 5000)),
+    recent=int(os.getenv("USED_ITEMS_IN_PROMPT", 30)),
+)
+# A lesson keeps at least this many vocabulary rows after repeats are dropped
+MIN_VOCAB_ROWS = 4
+
+async def lesson_exclusions(user_id: str, req: ClassRequest) -> dict:
+    await asyncio.gather(
+        used_items.add(user_id, PHRASES, req.used_phrases),
+        used_items.add(user_id, VOCAB, req.used_vocab),
+    )
+    return await used_items.exclusions(user_id)
+
+async def drop_used_vocabulary(user_id: str, class_plan: str) -> str:
+    # The prompt only lists recent exclusions, so check against the full set.
+    words = [entry["word"] for entry in parse_lesson(class_plan)["vocabulary"]]
+    repeated = await used_items.used(user_id, VOCAB, words)
+    if repeated and len(words) - len(repeated) >= MIN_VOCAB_ROWS:
+        logger.info("User %s - Dropped %s previously used vocabulary words.", user_id, len(repeated))
+        return drop_table_rows(class_plan, "Vocabulary", repeated)
+    return class_plan
+
+async def remember_lesson_items(user_id: str, structured: dict):
+    await asyncio.gather(
+        used_items.add(user_id, PHRASES, structured["quick_check"]["items"]),
+        used_items.add(user_id, VOCAB, [entry["word"] for entry in structured["vocabulary"]]),
+    )
+
+# Generated lessons kept for reuse by identical or near-identical requests
+lesson_cache = LessonCache(
+    max_entries=int(os.getenv("LESSON_CACHE_MAX_ENTRIES", 2000)),
+    max_bytes=int(os.getenv("LESSON_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl=int(os.getenv("LESSON_CACHE_TTL_SECONDS", 7 * 86400)),
+    min_similarity=float(os.getenv("LESSON_CACHE_MIN_SIMILARITY", 0.8)),
+)
+
+def cache_lesson(req: ClassRequest, class_plan: str):
+    structured = parse_lesson(class_plan)
+    lesson_cache.add(
+        cache_params(req),
+        class_plan,
+        vocabulary=[entry["word"] for entry in structured["vocabulary"]],
+        phrases=structured["quick_check"]["items"],
+    )
+
+async def cached_lesson(req: ClassRequest, user_id: str):
+    """Returns ``(class_plan, match)`` for a cached lesson this user hasn't seen, or ``(None, None)``."""
+    for entry in lesson_cache.candidates(cache_params(req)):
+        used_vocab, used_phrases = await asyncio.gather(
+            used_items.used(user_id, VOCAB, entry["vocabulary"]),
+            used_items.used(user_id, PHRASES, entry["phrases"]),
+        )
+        if not used_phrases and len(used_vocab) <= len(entry["vocabulary"]) // 4:
+            return entry["class_plan"], entry["match"]
+    return None, None
+
+async def save_lesson(user_id: str, req: ClassRequest, class_plan: str, structured: dict = None) -> str:
+    structured = structured or parse_lesson(class_plan)
+    await remember_lesson_items(user_id, structured)
+    return await lesson_store.save(
+        user_id,
+        class_plan,
+        structured=structured,
+        student_level=req.student_level,
+        skill_focus=req.skill_focus,
+        reason=req.reason,
+        badge=extract_badge(class_plan),
+    )
+
+def lesson_payload(class_plan: str, structured: dict, format: str) -> dict:
+    if format == "structured":
+        return {"lesson": structured}
+    return {"class_plan": class_plan}
 
 # Routes
 @app.get("/")
@@ -199,39 +717,17 @@ async def get_about(user: dict = Depends(get_current_user)):
             "Welcome to the Language Learning Arcade! 🎮\n\n"
             "We’re all about making language learning fun, engaging, and effective. Our AI-powered lessons, gamified progress tracking, and personalized feedback help you master English for travel, business, or personal growth. Join our arcade and level up your skills! 🚀"
         )
-        logger.info(f"User {user['user_id']} - Fetched About content")
+        logger.info("User %s - Fetched About content", user['user_id'])
         return {"content": content}
     except Exception as e:
-        logger.error(f"User {user['user_id']} - Error fetching About content: {str(e)}")
+        logger.error("User %s - Error fetching About content: %s", user['user_id'], e)
         raise HTTPException(status_code=500, detail=f"Error fetching About content: {str(e)}")
 
 @app.get("/remaining-calls")
 async def get_remaining_calls_endpoint(user: dict = Depends(get_current_user)):
     user_id = user["user_id"]
-    today = date.today().isoformat()
-    max_calls_per_day = 5
-    generate_key = f"generate_calls:{user_id}:{today}"
-    submit_key = f"submit_calls:{user_id}:{today}"
-
-    if redis_client:
-        try:
-            generate_calls = redis_client.get(generate_key) or 0
-            submit_calls = redis_client.get(submit_key) or 0
-        except redis.exceptions.RedisError:
-            generate_calls = fallback_limits.get(generate_key, 0)
-            submit_calls = fallback_limits.get(submit_key, 0)
-    else:
-        generate_calls = fallback_limits.get(generate_key, 0)
-        submit_calls = fallback_limits.get(submit_key, 0)
-
-    generate_calls = int(generate_calls)
-    submit_calls = int(submit_calls)
-
-    remaining = {
-        "generate": max_calls_per_day - generate_calls,
-        "submit": max_calls_per_day - submit_calls
-    }
-    logger.info(f"User {user_id} - Remaining calls: {remaining}")
+    remaining = remaining_quota(await get_quota_usage(user_id), user["tier"])
+    logger.info("User %s - Remaining calls: %s", user_id, remaining)
     return JSONResponse(
         content={"remaining_calls": remaining},
         headers={
@@ -240,176 +736,460 @@ async def get_remaining_calls_endpoint(user: dict = Depends(get_current_user)):
         }
     )
 
+@app.get("/quota")
+async def get_quota(user: dict = Depends(get_current_user)):
+    usage = await get_quota_usage(user["user_id"])
+    return {
+        "tier": user["tier"],
+        "remaining_calls": remaining_quota(usage, user["tier"]),
+        "used_calls": {endpoint: usage.get(endpoint, 0) for endpoint in QUOTA_ENDPOINTS},
+        "limits": DAILY_LIMITS,
+        "remaining_by_tier": {tier: remaining_quota(usage, tier) for tier in DAILY_LIMITS},
+    }
+
+async def produce_lesson(req: ClassRequest, user_id: str, format: str, tier: str = "free") -> dict:
+    logger.info("User %s - Generating class", user_id, extra={"fields": class_request_fields(req)})
+    start_time = time.time()
+    avoid = await lesson_exclusions(user_id, req)
+
+    class_plan = await lesson_pool.take(req, avoid[PHRASES] + avoid[VOCAB], tier)
+    if class_plan:
+        LESSONS_SERVED.inc(source="pool")
+        logger.info("User %s - Served pooled lesson in %.3f seconds.", user_id, time.time() - start_time)
+    else:
+        class_plan, match = await cached_lesson(req, user_id)
+        if class_plan:
+            LESSONS_SERVED.inc(source=f"cache_{match}")
+            logger.info("User %s - Served cached lesson (%s match).", user_id, match)
+            class_plan = vary_lesson(class_plan, user_id)
+    if not class_plan:
+        try:
+            class_plan, shared = await generate_lesson_plan(req, user_id, avoid, tier)
+        except CircuitOpenError as e:
+            # Any pooled lesson for these parameters beats failing outright.
+            class_plan = await lesson_pool.take(req, [], tier)
+            if not class_plan:
+                raise_openai_error(user_id, e)
+            LESSONS_SERVED.inc(source="fallback")
+            logger.info("User %s - OpenAI circuit open, served pooled lesson.", user_id)
+        except Exception as e:
+            raise_openai_error(user_id, e)
+        else:
+            response_time = time.time() - start_time
+            logger.info("User %s - OpenAI response received in %.2f seconds.", user_id, response_time)
+            LESSONS_SERVED.inc(source="shared" if shared else "openai")
+            if shared:
+                logger.info("User %s - Joined an in-flight identical lesson request.", user_id)
+                class_plan = vary_lesson(class_plan, user_id)
+
+    class_plan = await drop_used_vocabulary(user_id, class_plan)
+    structured = parse_lesson(class_plan)
+    lesson_id = await save_lesson(user_id, req, class_plan, structured)
+    with STAGE_SECONDS.time(stage="badge_parse"):
+        badge = extract_badge(class_plan)
+
+    return {
+        **lesson_payload(class_plan, structured, format),
+        "badge": badge,
+        "lesson_id": lesson_id,
+    }
+
+# Background lesson jobs (POST /generate-class?async=1, then GET /jobs/{id}).
+# Webhooks go only to JOB_WEBHOOK_HOSTS and are signed with JOB_WEBHOOK_SECRET
+# in an X-Webhook-Signature header; receivers check it with
+# jobs.verify_webhook (HMAC-SHA256 of "<t>.<raw body>", t within 5 minutes).
+job_store = JobStore(redis_client, ttl=int(os.getenv("JOB_TTL_SECONDS", 86400)))
+job_runner = JobRunner(
+    job_store,
+    workers=int(os.getenv("JOB_WORKERS", 8)),
+    max_queue=int(os.getenv("JOB_MAX_QUEUE", 200)),
+    webhook_hosts={host.strip() for host in os.getenv("JOB_WEBHOOK_HOSTS", "").split(",") if host.strip()},
+    webhook_secret=os.getenv("JOB_WEBHOOK_SECRET"),
+    name="lessons",
+)
+# Longest a GET /jobs/{id} request may wait for the job to finish
+JOB_MAX_WAIT_SECONDS = 25
+
+async def submit_job(runner: JobRunner, user: dict, run, *, cost: int = 1,
+                     callback_url: Optional[str] = None, idempotency_key: Optional[str] = None,
+                     job_id: Optional[str] = None, resume: Optional[dict] = None, **extra):
+    """Charges ``cost`` generate calls and queues ``run(remaining_calls)`` on ``runner``.
+
+    With ``resume`` state the job can be picked up again after a restart; the
+    remaining calls are added to it. A submission that isn't queued is not
+    billed: the charge is refunded before the idempotency key is released.
+    """
+    user_id = user["user_id"]
+    if callback_url and not runner.webhook_allowed(callback_url):
+        raise HTTPException(status_code=422, detail="callback_url must be an https URL on an allowed host.")
+    queue_full = HTTPException(
+        status_code=503, detail="Too many lessons are being generated right now.", headers={"Retry-After": "5"}
+    )
+    if runner.full():
+        raise queue_full
+
+    job_id = job_id or new_job_id()
+    if idempotency_key:
+        claimed = await job_store.claim(user_id, idempotency_key, job_id)
+        if claimed != job_id:
+            # A retry of a submission we already accepted: no new job, no new charge.
+            job = await job_store.get(claimed)
+            return JSONResponse(public_view(job) if job else {"job_id": claimed, "status": QUEUED}, status_code=202)
+
+    charged = False
+    try:
+        remaining_calls = await check_api_limit(user_id, "generate", user["tier"], cost)
+        charged = True
+        if resume is not None:
+            resume = {**resume, "remaining_calls": remaining_calls}
+        job = await runner.submit(job_id, user_id, lambda: run(remaining_calls), webhook=callback_url, resume=resume)
+    except BaseException as e:
+        # The queue can fill between the check above and submit.
+        if charged:
+            await refund_api_limit(user_id, "generate", cost)
+        if idempotency_key:
+            await job_store.release(user_id, idempotency_key)
+        if isinstance(e, JobQueueFullError):
+            raise queue_full
+        raise
+
+    logger.info("User %s - Queued job %s", user_id, job_id)
+    return JSONResponse({**public_view(job), **extra, "remaining_calls": remaining_calls}, status_code=202)
+
 @app.post("/generate-class")
-async def generate_class(req: ClassRequest, user: dict = Depends(get_current_user)):
+async def generate_class(
+    req: ClassRequest,
+    format: str = Query("markdown", pattern="^(markdown|structured)$"),
+    run_async: bool = Query(False, alias="async"),
+    callback_url: Optional[str] = Query(None, max_length=2000),
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user: dict = Depends(get_current_user),
+):
     user_id = user["user_id"]
+    if run_async:
+        async def run(remaining_calls: int):
+            return {**await produce_lesson(req, user_id, format, user["tier"]), "remaining_calls": remaining_calls}
+
+        return await submit_job(job_runner, user, run, callback_url=callback_url, idempotency_key=idempotency_key)
+
     try:
-        remaining_calls = check_api_limit(user_id, "generate")
-        logger.info(f"User {user_id} - Generating class: {req.dict()}")
-        start_time = time.time()
+        remaining_calls = await check_api_limit(user_id, "generate", user["tier"])
+        lesson = await produce_lesson(req, user_id, format, user["tier"])
 
-        teacher_styles = {
-            "Emma": "narrative-driven lessons with characters and plots",
-            "Liam": "interactive challenges and puzzles",
-            "Olivia": "practical real-world scenarios",
-            "Noah": "conversational practice with role-play scenarios",
-            "Sophia": "lessons incorporating songs and rhymes, especially engaging for younger learners",
-        }
-        teacher_style = teacher_styles.get(req.teacher, "a general teaching style, clear and encouraging")
-        age_group = "young learner" if req.age < 12 else "teenager" if 12 <= req.age <= 17 else "adult"
-        reason_context = f"learning English for {req.reason.lower()}" if req.reason else "general improvement"
-
-        video_links = {
-            "travel": {
-                "A1-A2": "https://www.youtube.com/watch?v=R9j00yG2yT4",
-                "B1-B2": "https://www.youtube.com/watch?v=Fj-0gT8vWl0",
-                "C1-C2": "https://www.youtube.com/watch?v=ZfJ006K6C5c"
-            },
-            "business": {
-                "A1-A2": "https://www.youtube.com/watch?v=sI9f9jT20K4",
-                "B1-B2": "https://www.youtube.com/watch?v=4b2C8t17G2Q",
-                "C1-C2": "https://www.youtube.com/watch?v=yW6gqV3L4hM"
-            },
-            "personal growth": {
-                "A1-A2": "https://www.youtube.com/watch?v=w_rM9M0lT7A",
-                "B1-B2": "https://www.youtube.com/watch?v=Xh0o-M5-S1M",
-                "C1-C2": "https://www.youtube.com/watch?v=ZfJ006K6C5c"
-            }
-        }
-        module_reason = "business" if "business" in req.reason.lower() else "travel" if "travel" in req.reason.lower() else "personal growth"
-        level_key = "A1-A2" if req.student_level in ["A1", "A2"] else "B1-B2" if req.student_level in ["B1", "B2"] else "C1-C2"
-        youtube_link = video_links.get(module_reason, {}).get(level_key, None)
-
-        skill_exercises = {
-            "Speaking": """
-            - Conversation Starter: Record a phrase with a specific tone (🎙).
-            - Dialogue Completion: Write 5 responses to a prompt.
-            - Example Sentences: [Teacher] says: Record 5-10 open-ended questions (🎙 for each).
-            """,
-            "Grammar": """
-            - Sentence Correction: Fix 5 sentences with errors.
-            - Gap-Fill: Complete sentences with correct forms.
-            - Example Sentences: [Teacher] says: Write 5-10 sentences using a specific grammar point.
-            """,
-            "Vocabulary": """
-            - Synonym Matching: Match 4 words to synonyms.
-            - Sentence Creation: Write sentences for 2 words.
-            - Example Sentences: [Teacher] says: Write 8 sentences using each vocabulary word.
-            """,
-            "Writing": """
-            - Paragraph Writing: Write a short paragraph.
-            - Email Composition: Draft a short email.
-            - Example Sentences: [Teacher] says: Write 5 sentences for a specific purpose.
-            """,
-            "Reading": f"""
-            - Reading Passage: Provide a short paragraph (50-100 words) relevant to {req.student_level} level and {reason_context}.
-            - Summarizing: Summarize the provided paragraph in 2-3 sentences.
-            - Questions: Answer 5 comprehension questions based on the provided paragraph.
-            - Example Sentences: [Teacher] says: Write 5 sentences summarizing the paragraph.
-            """
+        # Serialized here rather than by FastAPI so the cost shows up as a stage
+        with STAGE_SECONDS.time(stage="serialize"):
+            return JSONResponse({**lesson, "remaining_calls": remaining_calls})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error("User %s - Unexpected error in generate-class: %s", user_id, e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_SECONDS),
+    user: dict = Depends(get_current_user),
+):
+    job = await job_store.get(job_id)
+    if not job or job["user_id"] != user["user_id"]:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if wait and job["status"] not in FINISHED:
+        job = await job_runner.wait(job_id, wait) or job
+    return public_view(job)
+
+# Bulk lesson preparation through the OpenAI Batch API (OPENAI_BATCH_MODE=local
+# runs the same JSONL through openai_create instead, for tests and benchmarks)
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 50))
+if os.getenv("OPENAI_BATCH_MODE", "openai") == "local":
+    batch_backend = LocalBatchBackend(openai_create)
+    BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", 0.5))
+else:
+    batch_backend = OpenAIBatchBackend(get_openai_client)
+    BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", 30))
+
+class BatchClassRequest(BaseModel):
+    requests: list[ClassRequest] = Field(..., min_length=1, max_length=BATCH_MAX_REQUESTS)
+
+async def run_lesson_batch(user_id: str, job_id: str, unique: dict, order: list, tier: str,
+                           batch_id: str = None, submitted_at: float = None) -> dict:
+    routes = {key: router.route("lesson", req.student_level, req.skill_focus, tier) for key, (req, _) in unique.items()}
+    if batch_id:
+        # Resumed after a restart: the batch already exists upstream.
+        timeout = BATCH_TIMEOUT - (time.time() - (submitted_at or time.time()))
+        results = await wait_for_batch(batch_backend, batch_id, BATCH_POLL_SECONDS, max(timeout, BATCH_POLL_SECONDS))
+    else:
+        lines = [
+            batch_line(key, {**routes[key].params(), "messages": [{"role": "user", "content": prompt}]})
+            for key, (_, prompt) in unique.items()
+        ]
+
+        async def submitted(batch_id: str):
+            await job_store.update(job_id, ttl=BATCH_JOB_TTL, batch_id=batch_id, batch_submitted_at=time.time())
+
+        results = await run_batch(batch_backend, lines, poll_interval=BATCH_POLL_SECONDS, on_submit=submitted)
+
+    lessons = {}
+    for key, (req, _) in unique.items():
+        result = results.get(key) or {"error": "No result returned."}
+        if "error" in result:
+            lessons[key] = {"error": result["error"]}
+            continue
+        usage = result.get("usage") or {}
+        OPENAI_TOKENS.inc(usage.get("prompt_tokens", 0), type="prompt")
+        OPENAI_TOKENS.inc(usage.get("completion_tokens", 0), type="completion")
+        ROUTE_TOKENS.inc(usage.get("prompt_tokens", 0), route=routes[key].name, type="prompt")
+        ROUTE_TOKENS.inc(usage.get("completion_tokens", 0), route=routes[key].name, type="completion")
+        class_plan = sanitize_class_plan(result["content"] or "No lesson plan generated.")
+        cache_lesson(req, class_plan)
+        LESSONS_SERVED.inc(source="batch")
+        lessons[key] = {
+            "lesson_id": await save_lesson(user_id, req, class_plan),
+            "badge": extract_badge(class_plan),
         }
+    return {"lessons": [{"index": index, **lessons[key]} for index, key in enumerate(order)]}
 
-        avoid_phrases = ', '.join(bleach.clean(phrase, tags=[], strip=True) for phrase in req.used_phrases) if req.used_phrases else 'none'
-        avoid_vocab = ', '.join(bleach.clean(word, tags=[], strip=True) for word in req.used_vocab) if req.used_vocab else 'none'
-
-        prompt = f"""
-You are {req.teacher}, an engaging ESL teacher teaching a {req.student_level} level class focused on {req.skill_focus} for {reason_context}. The student is a {age_group} (age {req.age}). Use {teacher_style}.
-
-Generate a unique lesson plan in markdown with these sections:
-## Welcome
-A fun greeting with a clear objective for {req.skill_focus} (use **bold**, emojis 🚀).
-## Mini-lesson
-Key concepts in a table (3 columns, e.g., | Strategy | Phrase | Why It Works |). **Common Pitfall**: A bolded tip.
-## Quick Check
-Drag-and-drop with 4 phrases in 2 categories. Avoid: {avoid_phrases}.
-## Interactive Practice
-🎙 Skill-specific scenario. **[AI Feedback]** placeholder.
-## Role-Play Challenge
-🎙 Solo scenario. **[AI Feedback]** placeholder.
-## Practice Task
-Skill-specific writing task.
-## Exercises
-{skill_exercises.get(req.skill_focus, '')}
-Avoid: {avoid_phrases}.
-## Video
-[{req.skill_focus.title()} Video]({youtube_link}) relevant to {req.skill_focus}/{req.reason} (omit if no video available).
-## Vocabulary
-Table with 8+ unique words. Avoid: {avoid_vocab}.
-## Badge
-🏅 **[Unique badge name tied to {req.skill_focus}]**
-## Feedback
-Personalized feedback placeholder.
-
-Friendly tone. Markdown format.
-"""
+def resume_lesson_batch(job: dict):
+    """Rebuilds the run of a batch job from the state stored with it."""
+    state = job["resume"]
+    # Already validated and sanitized when first submitted
+    unique = {
+        key: (ClassRequest.model_construct(**entry["request"]), entry["prompt"])
+        for key, entry in state["requests"].items()
+    }
+
+    async def run():
+        lessons = await run_lesson_batch(
+            job["user_id"], job["id"], unique, state["order"], state["tier"],
+            batch_id=job.get("batch_id"), submitted_at=job.get("batch_submitted_at"),
+        )
+        return {**lessons, "remaining_calls": state["remaining_calls"]}
+
+    return run
+
+# Batches wait hours on OpenAI, so they get their own workers. Their jobs
+# outlive the default TTL and are resumed from the stored batch id if the
+# worker running them restarts.
+BATCH_JOB_TTL = int(os.getenv("BATCH_JOB_TTL_SECONDS", 2 * 86400))
+batch_jobs = JobRunner(
+    job_store,
+    workers=int(os.getenv("BATCH_JOB_WORKERS", 2)),
+    max_queue=int(os.getenv("BATCH_MAX_QUEUE", 20)),
+    webhook_hosts=job_runner.webhook_hosts,
+    webhook_secret=job_runner.webhook_secret,
+    name="batches",
+    ttl=BATCH_JOB_TTL,
+    resume=resume_lesson_batch,
+    lease_seconds=int(max(90, 3 * BATCH_POLL_SECONDS)),
+)
+
+@app.post("/generate-class/batch")
+async def generate_class_batch(
+    batch: BatchClassRequest,
+    callback_url: Optional[str] = Query(None, max_length=2000),
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user: dict = Depends(get_current_user),
+):
+    user_id = user["user_id"]
+    await asyncio.gather(
+        used_items.add(user_id, PHRASES, [item for req in batch.requests for item in req.used_phrases]),
+        used_items.add(user_id, VOCAB, [item for req in batch.requests for item in req.used_vocab]),
+    )
+    avoid = await used_items.exclusions(user_id)
+
+    # Identical parameter sets produce identical prompts and are generated once.
+    unique, order = {}, []
+    for req in batch.requests:
+        prompt = lesson_prompt(req, avoid[PHRASES], avoid[VOCAB])
+        key = hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+        unique.setdefault(key, (req, prompt))
+        order.append(key)
+    logger.info("User %s - Batch of %s lessons (%s unique)", user_id, len(order), len(unique))
+
+    job_id = new_job_id()
+
+    async def run(remaining_calls: int):
+        return {**await run_lesson_batch(user_id, job_id, unique, order, user["tier"]), "remaining_calls": remaining_calls}
+
+    resume = {
+        "tier": user["tier"],
+        "order": order,
+        "requests": {key: {"request": req.model_dump(), "prompt": prompt} for key, (req, prompt) in unique.items()},
+    }
+    return await submit_job(
+        batch_jobs, user, run,
+        cost=len(unique), callback_url=callback_url, idempotency_key=idempotency_key,
+        job_id=job_id, resume=resume, requests=len(order), unique=len(unique),
+    )
 
+@app.post("/generate-class/stream")
+async def generate_class_stream(req: ClassRequest, user: dict = Depends(get_current_user)):
+    user_id = user["user_id"]
+    try:
+        remaining_calls = await check_api_limit(user_id, "generate", user["tier"])
+        logger.info("User %s - Streaming class", user_id, extra={"fields": class_request_fields(req)})
+        start_time = time.time()
+        avoid = await lesson_exclusions(user_id, req)
+
+        pooled = await lesson_pool.take(req, avoid[PHRASES] + avoid[VOCAB], user["tier"])
+        if pooled:
+            LESSONS_SERVED.inc(source="pool")
+            logger.info("User %s - Streaming pooled lesson.", user_id)
+        else:
+            pooled, match = await cached_lesson(req, user_id)
+            if pooled:
+                LESSONS_SERVED.inc(source=f"cache_{match}")
+                logger.info("User %s - Streaming cached lesson (%s match).", user_id, match)
+                pooled = vary_lesson(pooled, user_id)
+        if pooled:
+            pooled = await drop_used_vocabulary(user_id, pooled)
+
+            lesson_id = await save_lesson(user_id, req, pooled)
+
+            async def pooled_events():
+                yield sse_event("chunk", {"text": pooled})
+                yield sse_event("done", {
+                    "badge": extract_badge(pooled),
+                    "lesson_id": lesson_id,
+                    "remaining_calls": remaining_calls
+                })
+
+            return ClosingStreamingResponse(
+                pooled_events(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        with STAGE_SECONDS.time(stage="prompt_build"):
+            prompt = lesson_prompt(req, avoid[PHRASES], avoid[VOCAB])
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
+            stream = await stream_completion(
+                user_id,
+                [{"role": "user", "content": prompt}],
+                router.route("lesson", req.student_level, req.skill_focus, user["tier"]),
             )
-            response_time = time.time() - start_time
-            logger.info(f"User {user_id} - OpenAI response received in {response_time:.2f} seconds.")
         except Exception as e:
-            logger.error(f"User {user_id} - OpenAI error: {str(e)}")
-            if "rate_limit" in str(e).lower():
-                raise HTTPException(status_code=429, detail="OpenAI rate limit exceeded. Try again later.")
-            raise HTTPException(status_code=503, detail=f"OpenAI service unavailable: {str(e)}")
-
-        class_plan = response.choices[0].message.content or "No lesson plan generated."
-        class_plan = bleach.clean(class_plan, tags=["b", "strong", "i", "em", "a"], attributes={"a": ["href"]}, strip=True)
-        badge_match = re.search(r"🏅\s*\*\*(.*?)\*\*", class_plan)
-        badge_name = badge_match.group(1) if badge_match else "Language Learner"
-
-        return {
-            "class_plan": class_plan,
-            "badge": badge_name,
-            "remaining_calls": remaining_calls
-        }
+            raise_openai_error(user_id, e)
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"User {user_id} - Unexpected error in generate-class: {str(e)}")
+        logger.error("User %s - Unexpected error in generate-class/stream: %s", user_id, e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.post("/submit-answer")
-async def submit_answer(req: AnswerRequest, user: dict = Depends(get_current_user)):
-    user_id = user["user_id"]
-    try:
-        remaining_calls = check_api_limit(user_id, "submit")
-        logger.info(f"User {user_id} - Submitting answer: {req.dict()}")
+    async def events():
+        sanitizer = IncrementalSanitizer(sanitize_class_plan)
+        parts = []
+        first_chunk = True
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = sanitizer.feed(chunk.choices[0].delta.content or "")
+                if text:
+                    if first_chunk:
+                        logger.info("User %s - First lesson chunk after %.2f seconds.", user_id, time.time() - start_time)
+                        first_chunk = False
+                    parts.append(text)
+                    yield sse_event("chunk", {"text": text})
+            text = sanitizer.flush()
+            if text:
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
 
-        prompt = f"""
-You are an AI teacher evaluating a student's answer.
+            class_plan = "".join(parts) or "No lesson plan generated."
+            LESSONS_SERVED.inc(source="stream")
+            cache_lesson(req, class_plan)
+            logger.info("User %s - OpenAI stream finished in %.2f seconds.", user_id, time.time() - start_time)
+            lesson_id = await save_lesson(user_id, req, class_plan)
+            yield sse_event("done", {
+                "badge": extract_badge(class_plan),
+                "lesson_id": lesson_id,
+                "remaining_calls": remaining_calls
+            })
+        except Exception as e:
+            logger.error("User %s - OpenAI stream error: %s", user_id, e)
+            yield sse_event("error", {"detail": "Lesson generation was interrupted. Please try again."})
+        finally:
+            await stream.aclose()
 
-Student Level: {req.student_level}
-Skill Focus: {req.skill_focus}
-Reason for learning: {req.reason}
+    return ClosingStreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-Student's Answer:
-{req.answer}
+@app.get("/lessons")
+async def lesson_history(
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[float] = Query(None),
+    user: dict = Depends(get_current_user),
+):
+    lessons = await lesson_store.history(user["user_id"], limit, before)
+    return {
+        "lessons": lessons,
+        "next_before": lessons[-1]["created_at"] if len(lessons) == limit else None,
+    }
 
-Class Plan for Reference:
-{req.class_plan}
+@app.get("/lessons/{lesson_id}")
+async def get_lesson(
+    lesson_id: str,
+    format: str = Query("markdown", pattern="^(markdown|structured)$"),
+    user: dict = Depends(get_current_user),
+):
+    lesson = await lesson_store.get(lesson_id)
+    if not lesson or lesson["user_id"] != user["user_id"]:
+        raise HTTPException(status_code=404, detail="Lesson not found.")
+    class_plan = lesson["class_plan"]
+    structured = None
+    if format == "structured":
+        structured = lesson.get("structured") or parse_lesson(class_plan)
+    return {
+        **lesson_payload(class_plan, structured, format),
+        "badge": extract_badge(class_plan),
+        "lesson_id": lesson_id,
+    }
 
-Provide:
-- Detailed constructive feedback in 1-2 paragraphs.
-- Corrections if necessary.
-- Suggestions for improvement.
+async def resolve_class_plan(req: AnswerRequest, user_id: str) -> str:
+    class_plan = req.class_plan
+    if req.lesson_id:
+        lesson = await lesson_store.get(req.lesson_id)
+        if not lesson or lesson["user_id"] != user_id:
+            raise HTTPException(status_code=404, detail="Lesson not found. Generate a new class and try again.")
+        class_plan = lesson["class_plan"]
+    if not class_plan:
+        raise HTTPException(status_code=422, detail="Either lesson_id or class_plan is required.")
+    return build_answer_context(class_plan, req.section, req.exercise, SUBMIT_CONTEXT_TOKEN_BUDGET)
 
-Use a positive and encouraging tone.
-Respond in markdown.
-"""
+@app.post("/submit-answer")
+async def submit_answer(req: AnswerRequest, user: dict = Depends(get_current_user)):
+    user_id = user["user_id"]
+    try:
+        class_plan = await resolve_class_plan(req, user_id)
+        remaining_calls = await check_api_limit(user_id, "submit", user["tier"])
+        logger.info("User %s - Submitting answer", user_id, extra={"fields": {
+            "level": req.student_level,
+            "skill": req.skill_focus,
+            "lesson_id": req.lesson_id,
+            "section": req.section,
+            "answer_chars": len(req.answer),
+            "class_plan_chars": len(req.class_plan),
+        }})
 
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8
-        )
+        with STAGE_SECONDS.time(stage="prompt_build"):
+            prompt = feedback_prompt(req, class_plan)
+
+        try:
+            response = await create_feedback_completion(
+                user_id,
+                [{"role": "user", "content": prompt}],
+                router.route("feedback", req.student_level, req.skill_focus, user["tier"]),
+            )
+        except Exception as e:
+            raise_openai_error(user_id, e)
 
         feedback = response.choices[0].message.content or "No feedback generated."
-        feedback = bleach.clean(feedback, tags=["b", "strong", "i", "em", "a"], attributes={"a": ["href"]}, strip=True)
+        with STAGE_SECONDS.time(stage="sanitize"):
+            feedback = LESSON_MARKUP.clean(feedback)
 
         return {
             "feedback": feedback,
@@ -418,7 +1198,7 @@ Respond in markdown.
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"User {user_id} - Unexpected error in submit-answer: {str(e)}")
+        logger.error("User %s - Unexpected error in submit-answer: %s", user_id, e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # Additional health check route
@@ -426,11 +1206,34 @@ Respond in markdown.
 async def health_check():
     return {"status": "ok"}
 
+# Operational endpoints need METRICS_TOKEN as a bearer token (Prometheus:
+# `authorization: {credentials: ...}`); without one configured they are off.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+async def require_metrics_token(authorization: str = Header(None)):
+    supplied = (authorization or "").removeprefix("Bearer ")
+    if not METRICS_TOKEN or not hmac.compare_digest(supplied.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+# OpenAI queue depth and scheduler counters
+@app.get("/openai-queue", dependencies=[Depends(require_metrics_token)])
+async def openai_queue():
+    return {**openai_scheduler.stats(), "circuit": openai_breaker.stats()}
+
+# Prometheus text exposition of request, stage and upstream metrics
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    stats = openai_scheduler.stats()
+    OPENAI_IN_FLIGHT.set(stats["active"])
+    for lane, queued in stats["queued"].items():
+        OPENAI_QUEUED.set(queued, lane=lane)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Redis health check route
 @app.get("/redis-health")
 async def redis_health():
     try:
-        redis_client.ping()
+        await redis_client.ping()
         return {"status": "Redis connected"}
     except redis.exceptions.RedisError as e:
         return {"status": "Redis unavailable", "error": str(e)}
@@ -0,0 +1,136 @@
+# backend/metrics.py
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds, from fast in-process stages up to slow OpenAI calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # One count per bucket (non-cumulative), then sum and count
+            series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# Request handling
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "End-to-end request latency", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "request_stage_duration_seconds",
+    "Latency of each request stage (auth_verify, rate_limit, prompt_build, openai_wait, sanitize, badge_parse, serialize)",
+    ("stage",),
+)
+
+# Upstream
+OPENAI_TOKENS = Counter("openai_tokens_total", "Tokens reported by response.usage", ("type",))
+OPENAI_REQUESTS = Counter("openai_requests_total", "Upstream OpenAI calls by outcome", ("outcome",))
+OPENAI_IN_FLIGHT = Gauge("openai_requests_in_flight", "OpenAI calls holding a scheduler slot")
+OPENAI_QUEUED = Gauge("openai_requests_queued", "OpenAI calls waiting in the scheduler", ("lane",))
+LESSONS_SERVED = Counter("lessons_served_total", "Lessons returned by source", ("source",))
+ROUTE_TOKENS = Counter("openai_route_tokens_total", "Realized tokens per routing rule", ("route", "type"))
+ROUTE_SECONDS = Histogram("openai_route_duration_seconds", "Completion latency per routing rule", ("route",))
+ROUTE_TRUNCATED = Counter("openai_route_truncated_total", "Completions cut off by max_tokens per routing rule", ("route",))
+
+# Redis and rate limiting
+REDIS_ERRORS = Counter("redis_errors_total", "Redis operations that failed", ("operation",))
+FALLBACK_LIMITER = Counter("rate_limit_fallback_total", "Quota checks served by the local fallback store", ("operation",))
+
@@ -0,0 +1,174 @@
+# backend/openai_scheduler.py
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+PRIORITY = "priority"
+NORMAL = "normal"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ("user_id", "lane", "estimated_tokens", "future", "enqueued_at", "granted_at", "released")
+
+    def __init__(self, user_id: str, lane: str, estimated_tokens: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.lane = lane
+        self.estimated_tokens = estimated_tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.released = False
+
+
+class OpenAIScheduler:
+    """Admission control in front of the OpenAI client.
+
+    Calls wait in per-user queues and are granted round-robin across users,
+    so one busy user can't take every upstream slot. The priority lane (short
+    submit-answer calls) is always drained before the normal lane. A global
+    concurrency cap and an optional tokens-per-minute bucket bound what goes
+    upstream at once.
+    """
+
+    def __init__(self, max_concurrency: int = 32, tokens_per_minute: int = 0,
+                 max_queue: int = 500, max_queue_per_user: int = 5):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._lanes = {PRIORITY: OrderedDict(), NORMAL: OrderedDict()}
+        self._queued = {PRIORITY: 0, NORMAL: 0}
+        self._active = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._wakeup = None
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # Token bucket
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _cost(self, ticket: Ticket) -> int:
+        return min(ticket.estimated_tokens, self.tokens_per_minute)
+
+    def _schedule_wakeup(self, needed: float):
+        if self._wakeup is not None:
+            return
+        delay = max(needed / (self.tokens_per_minute / 60.0), 0.01)
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    # Queueing
+    def _next(self):
+        for lane in (PRIORITY, NORMAL):
+            users = self._lanes[lane]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                ticket = queue[0]
+                if ticket.future.cancelled():
+                    queue.popleft()
+                    self._queued[lane] -= 1
+                    if not queue:
+                        del users[user_id]
+                    continue
+                return ticket
+        return None
+
+    def _pop(self, ticket: Ticket):
+        users = self._lanes[ticket.lane]
+        queue = users[ticket.user_id]
+        queue.popleft()
+        self._queued[ticket.lane] -= 1
+        if queue:
+            users.move_to_end(ticket.user_id)
+        else:
+            del users[ticket.user_id]
+
+    def _dispatch(self):
+        self._refill()
+        while self._active < self.max_concurrency:
+            ticket = self._next()
+            if ticket is None:
+                return
+            if self.tokens_per_minute:
+                cost = self._cost(ticket)
+                if self._tokens < cost:
+                    self._schedule_wakeup(cost - self._tokens)
+                    return
+                self._tokens -= cost
+            self._pop(ticket)
+            self._active += 1
+            ticket.granted_at = time.monotonic()
+            wait = ticket.granted_at - ticket.enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            ticket.future.set_result(ticket)
+
+    async def acquire(self, user_id: str, priority: bool = False, estimated_tokens: int = 0) -> Ticket:
+        lane = PRIORITY if priority else NORMAL
+        queue = self._lanes[lane].get(user_id)
+        if sum(self._queued.values()) >= self.max_queue or (queue and len(queue) >= self.max_queue_per_user):
+            self._rejected += 1
+            raise QueueFullError("Too many OpenAI requests are queued. Try again shortly.")
+        ticket = Ticket(user_id, lane, estimated_tokens, asyncio.get_running_loop().create_future())
+        self._lanes[lane].setdefault(user_id, deque()).append(ticket)
+        self._queued[lane] += 1
+        self._dispatch()
+        try:
+            return await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(ticket)
+            raise
+
+    def release(self, ticket: Ticket, used_tokens: int = None):
+        if ticket.released:
+            return
+        ticket.released = True
+        self._active -= 1
+        self._completed += 1
+        if self.tokens_per_minute and used_tokens is not None:
+            self._tokens -= used_tokens - self._cost(ticket)
+        self._dispatch()
+
+    async def run(self, user_id: str, call, priority: bool = False, estimated_tokens: int = 0):
+        ticket = await self.acquire(user_id, priority, estimated_tokens)
+        used_tokens = None
+        try:
+            result = await call()
+            usage = getattr(result, "usage", None)
+            used_tokens = getattr(usage, "total_tokens", None)
+            return result
+        finally:
+            self.release(ticket, used_tokens)
+
+    def stats(self) -> dict:
+        self._refill()
+        granted = self._completed + self._active
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": dict(self._queued),
+            "queued_users": {lane: len(users) for lane, users in self._lanes.items()},
+            "tokens_available": int(self._tokens) if self.tokens_per_minute else None,
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(self._wait_total / granted * 1000, 1) if granted else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 1),
+        }
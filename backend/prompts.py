@@ -0,0 +1,174 @@
+# backend/prompts.py
+from lesson_pool import age_group, reason_bucket
+
+# Prompts are laid out static-first: the instruction blocks shared by every
+# request come first and the per-user values (teacher, level, age, avoid
+# lists) last, so the request-specific details stay together at the end.
+
+TEACHER_STYLES = {
+    "Emma": "narrative-driven lessons with characters and plots",
+    "Liam": "interactive challenges and puzzles",
+    "Olivia": "practical real-world scenarios",
+    "Noah": "conversational practice with role-play scenarios",
+    "Sophia": "lessons incorporating songs and rhymes, especially engaging for younger learners",
+}
+DEFAULT_TEACHER_STYLE = "a general teaching style, clear and encouraging"
+
+VIDEO_LINKS = {
+    "travel": {
+        "A1-A2": "https://www.youtube.com/watch?v=R9j00yG2yT4",
+        "B1-B2": "https://www.youtube.com/watch?v=Fj-0gT8vWl0",
+        "C1-C2": "https://www.youtube.com/watch?v=ZfJ006K6C5c"
+    },
+    "business": {
+        "A1-A2": "https://www.youtube.com/watch?v=sI9f9jT20K4",
+        "B1-B2": "https://www.youtube.com/watch?v=4b2C8t17G2Q",
+        "C1-C2": "https://www.youtube.com/watch?v=yW6gqV3L4hM"
+    },
+    "personal growth": {
+        "A1-A2": "https://www.youtube.com/watch?v=w_rM9M0lT7A",
+        "B1-B2": "https://www.youtube.com/watch?v=Xh0o-M5-S1M",
+        "C1-C2": "https://www.youtube.com/watch?v=ZfJ006K6C5c"
+    }
+}
+
+SKILL_EXERCISES = {
+    "Speaking": """
+- Conversation Starter: Record a phrase with a specific tone (🎙).
+- Dialogue Completion: Write 5 responses to a prompt.
+- Example Sentences: [Teacher] says: Record 5-10 open-ended questions (🎙 for each).
+""",
+    "Grammar": """
+- Sentence Correction: Fix 5 sentences with errors.
+- Gap-Fill: Complete sentences with correct forms.
+- Example Sentences: [Teacher] says: Write 5-10 sentences using a specific grammar point.
+""",
+    "Vocabulary": """
+- Synonym Matching: Match 4 words to synonyms.
+- Sentence Creation: Write sentences for 2 words.
+- Example Sentences: [Teacher] says: Write 8 sentences using each vocabulary word.
+""",
+    "Writing": """
+- Paragraph Writing: Write a short paragraph.
+- Email Composition: Draft a short email.
+- Example Sentences: [Teacher] says: Write 5 sentences for a specific purpose.
+""",
+    "Reading": """
+- Reading Passage: Provide a short paragraph (50-100 words) relevant to the student's level and reason for learning.
+- Summarizing: Summarize the provided paragraph in 2-3 sentences.
+- Questions: Answer 5 comprehension questions based on the provided paragraph.
+- Example Sentences: [Teacher] says: Write 5 sentences summarizing the paragraph.
+""",
+}
+
+LESSON_INSTRUCTIONS = """You are an engaging ESL teacher. Generate a unique lesson plan in markdown with these sections:
+## Welcome
+A fun greeting with a clear objective for the skill focus (use **bold**, emojis 🚀).
+## Mini-lesson
+Key concepts in a table (3 columns, e.g., | Strategy | Phrase | Why It Works |). **Common Pitfall**: A bolded tip.
+## Quick Check
+Drag-and-drop with 4 phrases in 2 categories. Do not use any of the phrases to avoid listed below.
+## Interactive Practice
+🎙 Skill-specific scenario. **[AI Feedback]** placeholder.
+## Role-Play Challenge
+🎙 Solo scenario. **[AI Feedback]** placeholder.
+## Practice Task
+Skill-specific writing task.
+## Exercises
+Use the exercises for the skill focus listed below. Do not use any of the phrases to avoid.
+## Video
+[<Skill Focus> Video](<video link>) relevant to the skill focus and reason for learning, using the video link below (omit this section if no video is available).
+## Vocabulary
+Table with 8+ unique words. Do not use any of the vocabulary to avoid listed below.
+## Badge
+🏅 **[Unique badge name tied to the skill focus]**
+## Feedback
+Personalized feedback placeholder.
+
+Friendly tone. Markdown format.
+"""
+
+LESSON_DETAILS = """
+## Class details
+Teacher: {teacher}. Use {teacher_style}.
+Student level: {student_level}
+Skill focus: {skill_focus}
+Reason for learning: {reason_context}
+Student: a {age_group} (age {age})
+Video link: {video_link}
+Phrases to avoid: {avoid_phrases}
+Vocabulary to avoid: {avoid_vocab}
+"""
+
+FEEDBACK_INSTRUCTIONS = """You are an AI teacher evaluating a student's answer to an exercise from the lesson below.
+
+Provide:
+- Detailed constructive feedback in 1-2 paragraphs.
+- Corrections if necessary.
+- Suggestions for improvement.
+
+Use a positive and encouraging tone.
+Respond in markdown.
+"""
+
+FEEDBACK_DETAILS = """
+Student Level: {student_level}
+Skill Focus: {skill_focus}
+Reason for learning: {reason}
+
+Lesson Context:
+{class_plan}
+
+Student's Answer:
+{answer}
+"""
+
+
+def _compile_lesson_prefixes() -> dict:
+    # One static prefix per skill; the exercise block goes before anything
+    # user-specific so each skill keeps its own identical prefix.
+    return {
+        skill: f"{LESSON_INSTRUCTIONS}\n## Exercises for {skill}{exercises}"
+        for skill, exercises in SKILL_EXERCISES.items()
+    }
+
+
+LESSON_PREFIXES = _compile_lesson_prefixes()
+
+
+def level_band(level: str) -> str:
+    return "A1-A2" if level in ("A1", "A2") else "B1-B2" if level in ("B1", "B2") else "C1-C2"
+
+
+def avoid_list(items) -> str:
+    return ", ".join(items) if items else "none"
+
+
+def lesson_prompt(req, avoid_phrases=(), avoid_vocab=()) -> str:
+    """Builds the lesson prompt for a ClassRequest: static prefix, then class details.
+
+    The avoid lists are expected to be cleaned already (see used_items).
+    """
+    prefix = LESSON_PREFIXES.get(req.skill_focus) or LESSON_INSTRUCTIONS
+    return prefix + LESSON_DETAILS.format(
+        teacher=req.teacher,
+        teacher_style=TEACHER_STYLES.get(req.teacher, DEFAULT_TEACHER_STYLE),
+        student_level=req.student_level,
+        skill_focus=req.skill_focus,
+        reason_context=f"learning English for {req.reason.lower()}" if req.reason else "general improvement",
+        age_group=age_group(req.age),
+        age=req.age,
+        video_link=VIDEO_LINKS[reason_bucket(req.reason)][level_band(req.student_level)],
+        avoid_phrases=avoid_list(avoid_phrases),
+        avoid_vocab=avoid_list(avoid_vocab),
+    )
+
+
+def feedback_prompt(req, class_plan: str) -> str:
+    return FEEDBACK_INSTRUCTIONS + FEEDBACK_DETAILS.format(
+        student_level=req.student_level,
+        skill_focus=req.skill_focus,
+        reason=req.reason,
+        class_plan=class_plan,
+        answer=req.answer,
+    )
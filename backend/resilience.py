@@ -0,0 +1,163 @@
+# backend/resilience.py
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    # Bad requests are our fault, not a sign the upstream is unhealthy.
+    status = getattr(exc, "status_code", None)
+    if status is not None and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Fails fast while an upstream is unhealthy.
+
+    Calls are recorded over a sliding window; errors and calls slower than
+    ``slow_call_seconds`` both count as failures. Once the failure ratio
+    crosses ``failure_ratio`` the breaker opens for ``open_seconds``, then lets
+    a limited number of probe calls through (half-open) before closing again.
+    """
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 10, window_seconds: float = 60,
+                 slow_call_seconds: float = 20, open_seconds: float = 30, half_open_calls: int = 1,
+                 timeout: float = None):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.timeout = timeout
+        self.state = CLOSED
+        self._calls = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning("Circuit %s %s -> %s", self.name, self.state, state)
+            self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != HALF_OPEN:
+            self._probes = 0
+        if state == CLOSED:
+            self._calls.clear()
+
+    def check(self):
+        """Raises CircuitOpenError if a call would be rejected right now."""
+        if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable.")
+        if self.state == HALF_OPEN and self._probes >= self.half_open_calls:
+            raise CircuitOpenError(f"{self.name} is recovering; try again shortly.")
+
+    def _admit(self):
+        self.check()
+        if self.state == OPEN:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self._probes += 1
+
+    def _record(self, ok: bool, elapsed: float):
+        ok = ok and elapsed < self.slow_call_seconds
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED if ok else OPEN)
+            return
+        self._calls.append((now, ok))
+        self._trim(now)
+        failures = sum(1 for _, call_ok in self._calls if not call_ok)
+        if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_ratio:
+            self._transition(OPEN)
+
+    async def call(self, fn):
+        self._admit()
+        started = time.monotonic()
+        try:
+            if self.timeout:
+                result = await asyncio.wait_for(fn(), self.timeout)
+            else:
+                result = await fn()
+        except asyncio.CancelledError:
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                self._record(False, time.monotonic() - started)
+            elif self.state == HALF_OPEN:
+                self._probes -= 1
+            raise
+        self._record(True, time.monotonic() - started)
+        return result
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "failures": sum(1 for _, ok in self._calls if not ok),
+        }
+
+
+class LatencyTracker:
+    """Keeps recent latencies to derive a percentile for hedging."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def hedged(fn, delay: float):
+    """Runs ``fn`` and, if it hasn't finished after ``delay`` seconds, a second
+    copy alongside it. Returns the first successful result and cancels the other."""
+    # Every attempt is cancelled on the way out unless it already finished,
+    # including when the caller is cancelled during the initial wait.
+    tasks = [asyncio.ensure_future(fn())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        tasks.append(asyncio.ensure_future(fn()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,93 @@
+# backend/routing.py
+import json
+import logging
+import os
+
+from metrics import ROUTE_SECONDS, ROUTE_TOKENS, ROUTE_TRUNCATED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing.json")
+
+# Used for any endpoint the config file doesn't define
+DEFAULT_ROUTES = {
+    "lesson": {"model": "gpt-4o-mini", "max_tokens": 1500, "temperature": 0.7},
+    "feedback": {"model": "gpt-4o-mini", "max_tokens": 500, "temperature": 0.8},
+}
+MATCH_FIELDS = ("endpoint", "student_level", "skill_focus", "tier")
+SETTINGS = ("model", "max_tokens", "temperature")
+
+
+class Route:
+    def __init__(self, name: str, model: str, max_tokens: int, temperature: float):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def params(self) -> dict:
+        return {"model": self.model, "max_tokens": self.max_tokens, "temperature": self.temperature}
+
+    def record(self, usage, seconds: float = None, finish_reason: str = None):
+        """Reports realized tokens and latency for a completion served on this route."""
+        if usage:
+            ROUTE_TOKENS.inc(usage.prompt_tokens, route=self.name, type="prompt")
+            ROUTE_TOKENS.inc(usage.completion_tokens, route=self.name, type="completion")
+        if seconds is not None:
+            ROUTE_SECONDS.observe(seconds, route=self.name)
+        if finish_reason == "length":
+            ROUTE_TRUNCATED.inc(route=self.name)
+
+
+class Router:
+    """Picks model, max_tokens and temperature for a call.
+
+    The config file has per-endpoint ``defaults`` and an ordered list of
+    ``rules``. Each rule has a ``match`` on endpoint, student_level,
+    skill_focus and tier (a value or a list of values), optional settings that
+    override the defaults, and a ``name`` used to label its metrics. The
+    first matching rule wins.
+    """
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.defaults = {
+            endpoint: {**DEFAULT_ROUTES.get(endpoint, {}), **settings}
+            for endpoint, settings in {**DEFAULT_ROUTES, **config.get("defaults", {})}.items()
+        }
+        self.rules = config.get("rules", [])
+        for rule in self.rules:
+            unknown = set(rule.get("match", {})) - set(MATCH_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown routing match fields: {', '.join(sorted(unknown))}")
+        self._routes = {}
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_CONFIG_PATH):
+        if not os.path.exists(path):
+            logger.info("No routing config at %s, using defaults", path)
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _matches(match: dict, request: dict) -> bool:
+        for field, expected in match.items():
+            values = expected if isinstance(expected, list) else [expected]
+            if request.get(field) not in values:
+                return False
+        return True
+
+    def route(self, endpoint: str, student_level: str = None, skill_focus: str = None, tier: str = "free") -> Route:
+        key = (endpoint, student_level, skill_focus, tier)
+        route = self._routes.get(key)
+        if route is None:
+            request = dict(zip(MATCH_FIELDS, key))
+            settings, name = self.defaults[endpoint], f"{endpoint}-default"
+            for index, rule in enumerate(self.rules):
+                if self._matches(rule.get("match", {}), request):
+                    settings = {**settings, **{k: rule[k] for k in SETTINGS if k in rule}}
+                    name = rule.get("name", f"{endpoint}-rule{index}")
+                    break
+            route = self._routes[key] = Route(name, settings["model"], settings["max_tokens"], settings["temperature"])
+        return route
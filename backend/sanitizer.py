@@ -0,0 +1,60 @@
+# backend/sanitizer.py
+import re
+from collections import OrderedDict
+
+# Anything the HTML parser would change: markup, entities, NUL, and the C0
+# control characters other than tab and newline (\r is normalized, the rest
+# become "?"). Text without these comes back with only ">" escaped.
+NEEDS_PARSE = re.compile(r"[<&\x00-\x08\x0b-\x1f]")
+
+
+class Policy:
+    """An allow-list sanitizer with a fast path and a bounded memo.
+
+    The bleach ``Cleaner`` is built once per policy, on the first input that
+    needs parsing, instead of on every call (or at import).
+    Plain text skips the HTML parse entirely; other inputs are memoized, so
+    repeats (the same lesson sent back with each answer) are parsed once.
+    Inputs longer than ``max_memo_chars`` are not memoized, and
+    ``memo_size=0`` turns the memo off for inputs that never repeat.
+    """
+
+    def __init__(self, tags=(), attributes=None, memo_size: int = 512, max_memo_chars: int = 64 * 1024):
+        self.tags = set(tags)
+        self.attributes = attributes or {}
+        self._cleaner = None
+        self.memo_size = memo_size
+        self.max_memo_chars = max_memo_chars
+        self._memo = OrderedDict()
+
+    def clean(self, text: str) -> str:
+        if not NEEDS_PARSE.search(text):
+            return text.replace(">", "&gt;")
+        cleaned = self._memo.get(text)
+        if cleaned is not None:
+            self._memo.move_to_end(text)
+            return cleaned
+        cleaned = self.cleaner.clean(text)
+        if self.memo_size and len(text) <= self.max_memo_chars:
+            self._memo[text] = cleaned
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return cleaned
+
+    @property
+    def cleaner(self):
+        if self._cleaner is None:
+            from bleach.sanitizer import Cleaner
+
+            self._cleaner = Cleaner(tags=self.tags, attributes=self.attributes, strip=True)
+        return self._cleaner
+
+    __call__ = clean
+
+
+# Plain text only: reasons, used phrases and vocabulary
+STRIP_ALL = Policy()
+# Student input: answers and lesson text sent back with them
+BASIC_FORMATTING = Policy(tags=("b", "strong", "i", "em"))
+# Model output: lessons and feedback. Every output is new, so no memo.
+LESSON_MARKUP = Policy(tags=("b", "strong", "i", "em", "a"), attributes={"a": ["href"]}, memo_size=0)
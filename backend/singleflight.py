@@ -0,0 +1,33 @@
+# backend/singleflight.py
+import asyncio
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts ``fn``; everyone who arrives while it is
+    still running awaits the same result. The call is shielded, so a caller
+    that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn):
+        """Returns ``(result, shared)``; ``shared`` is True for callers that joined an existing call."""
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,43 @@
+# backend/startup.py
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+async def _run_step(name: str, step, timeout: float) -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(step(), timeout)
+        status, error = OK, None
+    except asyncio.TimeoutError:
+        status, error = TIMEOUT, f"no answer within {timeout:g}s"
+    except Exception as e:
+        status, error = ERROR, str(e)
+    result = {"step": name, "status": status, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    if error:
+        result["error"] = error
+        logger.warning("Startup step %s: %s (%s)", name, status, error)
+    return result
+
+
+async def warm_up(steps: dict, timeout: float = 5.0) -> dict:
+    """Runs the ``steps`` (name -> async callable) concurrently, each with ``timeout``.
+
+    A step that fails or times out is reported rather than raised, so an
+    unreachable dependency delays startup by at most ``timeout``. Returns
+    each step's result keyed by name.
+    """
+    results = await asyncio.gather(*(_run_step(name, step, timeout) for name, step in steps.items()))
+    return {result["step"]: result for result in results}
+
+
+def report(import_seconds: float, steps: dict, total_seconds: float) -> str:
+    parts = [f"import {import_seconds * 1000:.0f}ms"]
+    parts += [f"{name} {result['status']} {result['ms']:.0f}ms" for name, result in steps.items()]
+    return f"Startup took {total_seconds * 1000:.0f}ms: " + ", ".join(parts)
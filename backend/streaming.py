@@ -0,0 +1,79 @@
+# backend/streaming.py
+import json
+
+import anyio
+from starlette.responses import StreamingResponse
+
+# How much text we are willing to hold back while waiting for a tag or
+# entity to close before giving up and sanitizing it as plain text.
+MAX_HOLD_CHARS = 256
+MAX_ENTITY_CHARS = 12
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def close_stream(stream):
+    """Closes a completion stream so the upstream response (and generation) stops.
+
+    Handles the OpenAI ``AsyncStream`` (``close``) as well as async generators
+    such as the cassette's wrapped and replayed streams (``aclose``).
+    """
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close:
+        await close()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """A StreamingResponse that always closes its body iterator.
+
+    Starlette stops iterating when the client disconnects but leaves the
+    generator suspended until it is garbage collected, so its ``finally``
+    (which releases the upstream stream) could run much later.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+
+class IncrementalSanitizer:
+    """Sanitizes streamed text chunk by chunk.
+
+    Text is only released up to a point where no HTML tag or entity is left
+    open, so the sanitizer never sees half a tag. The held-back tail is
+    prepended to the next chunk and released by ``flush`` at the end.
+    """
+
+    def __init__(self, clean):
+        self.clean = clean
+        self._buffer = ""
+
+    def _safe_cut(self) -> int:
+        buffer = self._buffer
+        cut = len(buffer)
+        lt = buffer.rfind("<")
+        if lt != -1 and buffer.find(">", lt) == -1 and cut - lt <= MAX_HOLD_CHARS:
+            cut = lt
+        amp = buffer.rfind("&", 0, cut)
+        if amp != -1 and ";" not in buffer[amp:cut] and cut - amp <= MAX_ENTITY_CHARS:
+            cut = amp
+        if cut and buffer[cut - 1] == "\r":
+            cut -= 1
+        return cut
+
+    def feed(self, text: str) -> str:
+        if not text:
+            return ""
+        self._buffer += text
+        cut = self._safe_cut()
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self.clean(ready) if ready else ""
+
+    def flush(self) -> str:
+        ready, self._buffer = self._buffer, ""
+        return self.clean(ready) if ready else ""
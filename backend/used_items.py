@@ -0,0 +1,141 @@
+# backend/used_items.py
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict, deque
+
+import redis
+
+from metrics import REDIS_ERRORS
+from sanitizer import STRIP_ALL
+
+logger = logging.getLogger(__name__)
+
+PHRASES = "phrases"
+VOCAB = "vocab"
+
+# Longest item considered when hashing; longer entries are not real phrases
+MAX_ITEM_CHARS = 200
+
+
+def normalize(item) -> str:
+    return " ".join(str(item).split()).casefold()[:MAX_ITEM_CHARS]
+
+
+def item_hash(item) -> str:
+    return hashlib.blake2b(normalize(item).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class UsedItems:
+    """Per-user record of the phrases and vocabulary a learner has already seen.
+
+    Each kind is kept as a Redis sorted set of 64-bit item hashes scored by
+    last use, which is compact and cheap to check against, plus a short
+    capped list of the most recent cleaned texts; only that list goes into
+    prompts. Sets are trimmed to ``max_items`` and expire after ``ttl`` of
+    inactivity. A bounded process-local copy is used while Redis is down.
+    """
+
+    def __init__(self, redis_client, max_items: int = 5000, recent: int = 30,
+                 ttl: int = 180 * 86400, max_local_users: int = 10000):
+        self.redis_client = redis_client
+        self.max_items = max_items
+        self.recent_size = recent
+        self.ttl = ttl
+        self.max_local_users = max_local_users
+        self._local = OrderedDict()
+
+    @staticmethod
+    def _keys(user_id: str, kind: str) -> tuple:
+        return f"used:{user_id}:{kind}", f"used:{user_id}:{kind}:recent"
+
+    def _local_entry(self, user_id: str, kind: str):
+        key = (user_id, kind)
+        entry = self._local.get(key)
+        if entry is None:
+            entry = self._local[key] = (OrderedDict(), deque(maxlen=self.recent_size))
+            while len(self._local) > self.max_local_users:
+                self._local.popitem(last=False)
+        self._local.move_to_end(key)
+        return entry
+
+    async def _known(self, user_id: str, kind: str, hashes: list) -> set:
+        if self.redis_client:
+            try:
+                scores = await self.redis_client.zmscore(self._keys(user_id, kind)[0], hashes)
+                return {h for h, score in zip(hashes, scores) if score is not None}
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="used_items")
+                logger.warning("Used items Redis read failed for %s: %s", user_id, e)
+        seen, _ = self._local_entry(user_id, kind)
+        return {h for h in hashes if h in seen}
+
+    async def add(self, user_id: str, kind: str, items: list) -> int:
+        """Records ``items`` as used and returns how many were new.
+
+        Items are deduplicated by hash first, so only unseen ones are cleaned
+        and added to the recent list.
+        """
+        hashes = OrderedDict()
+        for item in items:
+            if normalize(item):
+                hashes.setdefault(item_hash(item), item)
+        if not hashes:
+            return 0
+        known = await self._known(user_id, kind, list(hashes))
+        texts = [
+            text for text in (
+                STRIP_ALL.clean(str(item)[:MAX_ITEM_CHARS]).strip()
+                for h, item in hashes.items() if h not in known
+            ) if text
+        ]
+
+        if self.redis_client:
+            set_key, recent_key = self._keys(user_id, kind)
+            now = time.time()
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.zadd(set_key, {h: now for h in hashes})
+                pipe.zremrangebyrank(set_key, 0, -self.max_items - 1)
+                pipe.expire(set_key, self.ttl)
+                if texts:
+                    pipe.lpush(recent_key, *texts)
+                    pipe.ltrim(recent_key, 0, self.recent_size - 1)
+                    pipe.expire(recent_key, self.ttl)
+                await pipe.execute()
+                return len(hashes) - len(known)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="used_items")
+                logger.warning("Used items Redis write failed for %s: %s", user_id, e)
+
+        seen, recent = self._local_entry(user_id, kind)
+        for h in hashes:
+            seen[h] = None
+            seen.move_to_end(h)
+        while len(seen) > self.max_items:
+            seen.popitem(last=False)
+        recent.extendleft(texts)
+        return len(hashes) - len(known)
+
+    async def recent(self, user_id: str, kind: str) -> list:
+        """Most recently added items, newest first."""
+        if self.redis_client:
+            try:
+                return await self.redis_client.lrange(self._keys(user_id, kind)[1], 0, self.recent_size - 1)
+            except redis.exceptions.RedisError as e:
+                REDIS_ERRORS.inc(operation="used_items")
+                logger.warning("Used items Redis read failed for %s: %s", user_id, e)
+        return list(self._local_entry(user_id, kind)[1])
+
+    async def used(self, user_id: str, kind: str, items: list) -> set:
+        """Returns the subset of ``items`` already in the user's full set."""
+        hashes = {item: item_hash(item) for item in items if normalize(item)}
+        if not hashes:
+            return set()
+        known = await self._known(user_id, kind, list(set(hashes.values())))
+        return {item for item, h in hashes.items() if h in known}
+
+    async def exclusions(self, user_id: str) -> dict:
+        phrases, vocab = await asyncio.gather(self.recent(user_id, PHRASES), self.recent(user_id, VOCAB))
+        return {PHRASES: phrases, VOCAB: vocab}